@@ -0,0 +1,461 @@
+import util
+import random
+import GameBoard as gb
+
+#######################################################
+#######################################################
+# BitBoard.py
+#
+# An alternative GameBoard engine. Every zone (deck, pile,
+# discard and each player's hand, up cards and down cards)
+# is stored as a 52-bit integer mask, one bit per card.
+# Playable card and rank queries are a single AND against a
+# table of "playable on top card X" masks.
+#
+# The deck and pile are also kept as Stacks, and the hands,
+# up cards and down cards as lists in the same order
+# GameBoard keeps them, because card order reaches the
+# agents and their random choices. The public API and card
+# order are the same as GameBoard's, so Game and the agents
+# can use either engine and a seeded game plays out the
+# same way on both.
+#######################################################
+#######################################################
+
+ALL_CARDS = (1 << 52) - 1
+
+# Builds the table of playable masks from util.PLAYABLE. Entry i is the mask
+# of cards playable on the card with index i; entry util.EMPTY_PILE is the
+# mask for an empty pile.
+def buildPlayableMasks():
+	masks = []
+	for row in util.PLAYABLE:
+		mask = 0
+		for index in range(0, 52):
+			if row[index]:
+				mask |= 1 << index
+		masks.append(mask)
+	return masks
+
+PLAYABLE_MASKS = buildPlayableMasks()
+
+# RANK_MASKS[rank] is the mask of the four cards of rank.
+RANK_MASKS = [0, 0] + [sum([1 << card.index for card in util.CARDS if card.rank == rank]) for rank in range(2, 15)]
+NON_WILD_MASK = sum([RANK_MASKS[rank] for rank in util.NON_WILD_RANKS])
+
+# Represents a configuration of the cards on the table and in players' hands,
+# with every zone stored as a bit mask.
+class BitBoard(gb.GameBoard):
+
+	# Initializes and shuffles the deck, deals cards to
+	# players. Deals in the same order as GameBoard, so a
+	# given random state produces the same deal on either engine.
+	def __init__(self, players, rng=random, deckOrder=None):
+		self.pile = util.PileStack()
+		self.deck = util.Stack()
+		self.discard = util.Stack()
+		self.players = players
+
+		# Dicts with mappings agentID:list, in GameBoard's order.
+		self.hands = dict()
+		self.upCards = dict()
+		self.downCards = dict()
+		# Dicts with mappings agentID:mask of the same cards.
+		self.handMasks = dict()
+		self.upMasks = dict()
+		self.downMasks = dict()
+
+		# Masks of the shared zones.
+		self.deckMask = 0
+		self.pileMask = 0
+		self.discardMask = 0
+
+		# Mutations made through apply() are logged here so undo() can revert them.
+		self.undoLog = []
+		self.logging = False
+
+		# Initialize and shuffle the deck.
+		if deckOrder == None:
+			tempDeck = list(util.CARDS)
+			rng.shuffle(tempDeck)
+		else:
+			tempDeck = list(deckOrder)
+		self.deckOrder = tuple(tempDeck)
+		self.deck.pushList(tempDeck)
+		self.deckMask = ALL_CARDS
+
+		for player in self.players:
+			ID = player.getID()
+			self.downCards[ID] = self.deal(3)
+			self.upCards[ID] = self.deal(3)
+			self.hands[ID] = self.deal(3)
+			self.downMasks[ID] = self.cardsToMask(self.downCards[ID])
+			self.upMasks[ID] = self.cardsToMask(self.upCards[ID])
+			self.handMasks[ID] = self.cardsToMask(self.hands[ID])
+
+		self.initHash()
+
+	# Pops numCards cards off the deck and returns them as a list.
+	def deal(self, numCards):
+		cards = []
+		for i in range(0, numCards):
+			cards.append(self.deck.pop())
+		self.deckMask &= ~self.cardsToMask(cards)
+		return cards
+
+	# Returns the cards of cardList whose bits are set in mask, in
+	# cardList's order.
+	def filterCards(self, cardList, mask):
+		if mask == 0:
+			return []
+		return [card for card in cardList if mask >> card.index & 1]
+
+	# Returns the mask with one bit set for each card in cardList.
+	def cardsToMask(self, cardList):
+		mask = 0
+		for card in cardList:
+			mask |= 1 << card.index
+		return mask
+
+	# XORs into the hash the keys of the cards in mask moving from the
+	# zone with fromKeys to the zone with toKeys.
+	def moveKeys(self, mask, fromKeys, toKeys):
+		while mask:
+			lowBit = mask & -mask
+			index = lowBit.bit_length() - 1
+			self.hash ^= fromKeys[index] ^ toKeys[index]
+			mask ^= lowBit
+
+	# Returns the playable mask for the card currently on top of the pile.
+	def playableMask(self):
+		pileCards = self.pile.list
+		if pileCards == []:
+			return PLAYABLE_MASKS[util.EMPTY_PILE]
+		return PLAYABLE_MASKS[pileCards[-1].index]
+
+	#######################################################
+	#######################################################
+	# BOOLEAN ACCESSOR METHODS:
+	#######################################################
+	#######################################################
+
+	# Returns True iff game is over.
+	def isTerminal(self):
+		for player in self.players:
+			ID = player.getID()
+			if self.downMasks[ID] == 0 and self.handMasks[ID] == 0:
+				return True
+
+	# Returns True iff down cards are playable for player with agentID.
+	def downCardsPlayable(self, agentID):
+		return self.upMasks[agentID] == 0 and self.handMasks[agentID] == 0
+
+	# Returns True iff up cards are playable for player with agentID.
+	def upCardsPlayable(self, agentID):
+		return self.handMasks[agentID] == 0 and not self.upMasks[agentID] == 0
+
+	# Returns True iff player can legally make swap.
+	def isLegalSwap(self, upCard, handCard, player):
+		if not (upCard is util.CARDS[upCard.index] and handCard is util.CARDS[handCard.index]):
+			return False
+		ID = player.getID()
+		upBit = 1 << upCard.index
+		handBit = 1 << handCard.index
+		return bool(self.upMasks[ID] & upBit) and bool(self.handMasks[ID] & handBit)
+
+	# Returns True iff every card of cardList is in zoneMask and playable on the pile,
+	# all cards have the same rank and no card is listed twice.
+	def isLegalPlayFrom(self, zoneMask, cardList):
+		rank = cardList[0].rank
+		actionMask = 0
+		for card in cardList:
+			bit = 1 << card.index
+			if not card.rank == rank or actionMask & bit:
+				return False
+			actionMask |= bit
+		return actionMask & ~(zoneMask & self.playableMask()) == 0
+
+	# Returns True iff player can legally play upCardsToPlay.
+	def isLegalUpCardPlay(self, upCardsToPlay, player):
+		upCards = self.upMasks[player.getID()]
+		if upCardsToPlay == []:
+			return upCards & self.playableMask() == 0
+		return self.isLegalPlayFrom(upCards, upCardsToPlay)
+
+	# Returns True iff player can legally play handCardsToPlay.
+	def isLegalHandCardPlay(self, handCardsToPlay, player):
+		hand = self.handMasks[player.getID()]
+		if handCardsToPlay == []:
+			return hand & self.playableMask() == 0
+		return self.isLegalPlayFrom(hand, handCardsToPlay)
+
+	#######################################################
+	#######################################################
+	# NON-BOOLEAN ACCESSOR METHODS:
+	#######################################################
+	#######################################################
+
+	# Returns a live HandView of player's hand.
+	def getHandView(self, player):
+		return BitHandView(self, player.getID())
+
+	# Returns a list of legal hand cards for an agent. [] implies no legal hand cards.
+	def getPlayableHandCards(self, player):
+		ID = player.getID()
+		return self.filterCards(self.hands[ID], self.handMasks[ID] & self.playableMask())
+
+	# Returns a list of legal up cards for an agent. [] implies no legal up cards.
+	def getPlayableUpCards(self, player):
+		ID = player.getID()
+		return self.filterCards(self.upCards[ID], self.upMasks[ID] & self.playableMask())
+
+	#######################################################
+	#######################################################
+	# MUTATOR METHODS:
+	#######################################################
+	#######################################################
+
+	# Moves the cards of cardList, in order, from zone (a player's list,
+	# whose cards have hash keys zoneKeys) onto the pile and returns their
+	# mask. Logs an entry of kind first and fills in its positions card by
+	# card, so a card missing from zone leaves an entry that undoes the
+	# cards moved.
+	def playToPile(self, kind, ID, zone, zoneKeys, cardList):
+		pileKeys = gb.ZONE_KEYS[gb.ZONE_PILE]
+		positions = []
+		if self.logging:
+			self.undoLog.append((kind, ID, positions))
+		mask = 0
+		for card in cardList:
+			position = zone.index(card)
+			del zone[position]
+			self.pile.push(card)
+			positions.append(position)
+			mask |= 1 << card.index
+			self.hash ^= zoneKeys[card.index] ^ pileKeys[card.index]
+		self.pileMask |= mask
+		self.rehashPileTop()
+		return mask
+
+	# Places cards from player's hand into the pile.
+	def handToPile(self, player, cardList):
+		ID = player.getID()
+		self.handMasks[ID] &= ~self.playToPile(gb.UNDO_HAND_TO_PILE, ID, self.hands[ID], self.handKeys[ID], cardList)
+		return self.draw(player)
+
+	# Places cards from the pile into player's hand, top card first.
+	def pileToHand(self, player):
+		ID = player.getID()
+		if self.logging:
+			self.undoLog.append((gb.UNDO_PICKUP, ID, self.pile, self.pileMask))
+		self.hands[ID].extend(reversed(self.pile.list))
+		self.handMasks[ID] |= self.pileMask
+		self.moveKeys(self.pileMask, gb.ZONE_KEYS[gb.ZONE_PILE], self.handKeys[ID])
+		self.pileMask = 0
+		self.pile = util.PileStack()
+		self.rehashPileTop()
+
+	# Places cards from player's up cards into the pile.
+	def upCardsToPile(self, player, cardList):
+		ID = player.getID()
+		self.upMasks[ID] &= ~self.playToPile(gb.UNDO_UP_TO_PILE, ID, self.upCards[ID], self.upKeys[ID], cardList)
+
+	# Places one of player's down cards on the pile.
+	def downCardToPile(self, player, card):
+		ID = player.getID()
+		self.downMasks[ID] &= ~self.playToPile(gb.UNDO_DOWN_TO_PILE, ID, self.downCards[ID], self.downKeys[ID], [card])
+
+	# Sends the pile to the discard pile. Raises ValueError if the pile is empty.
+	def clearPile(self):
+		if self.pileMask == 0:
+			raise ValueError("Cannot clear an empty pile")
+		if self.logging:
+			self.undoLog.append((gb.UNDO_CLEAR, self.pile.size(), self.pileMask))
+		topCard = self.pile.pop()
+		while not self.pile.isEmpty():
+			self.discard.push(self.pile.pop())
+		self.discard.push(topCard)
+		self.moveKeys(self.pileMask, gb.ZONE_KEYS[gb.ZONE_PILE], gb.ZONE_KEYS[gb.ZONE_DISCARD])
+		self.discardMask |= self.pileMask
+		self.pileMask = 0
+		self.rehashPileTop()
+
+	# Used to clear 3s from the top of the pile.
+	def clearThrees(self):
+		numCleared = 0
+		topCard = self.pile.peek()
+		while not topCard == None and topCard.getRank() == 3:
+			self.pile.pop()
+			self.discard.push(topCard)
+			bit = 1 << topCard.index
+			self.pileMask &= ~bit
+			self.discardMask |= bit
+			self.hash ^= gb.ZONE_KEYS[gb.ZONE_PILE][topCard.index] ^ gb.ZONE_KEYS[gb.ZONE_DISCARD][topCard.index]
+			numCleared += 1
+			topCard = self.pile.peek()
+		self.rehashPileTop()
+		if self.logging:
+			self.undoLog.append((gb.UNDO_CLEAR_THREES, numCleared))
+
+	# Applies a swap, assuming it's legal. The lists change as in GameBoard.
+	def applySwap(self, swap, player):
+		upSwap = swap[0]
+		handSwap = swap[1]
+		ID = player.getID()
+		upCards = self.upCards[ID]
+		hand = self.hands[ID]
+		upPosition = upCards.index(upSwap)
+		handPosition = hand.index(handSwap)
+		del upCards[upPosition]
+		hand.append(upSwap)
+		del hand[handPosition]
+		upCards.append(handSwap)
+		upBit = 1 << upSwap.index
+		handBit = 1 << handSwap.index
+		self.upMasks[ID] = (self.upMasks[ID] & ~upBit) | handBit
+		self.handMasks[ID] = (self.handMasks[ID] & ~handBit) | upBit
+		self.moveKeys(upBit, self.upKeys[ID], self.handKeys[ID])
+		self.moveKeys(handBit, self.handKeys[ID], self.upKeys[ID])
+		if self.logging:
+			self.undoLog.append((gb.UNDO_SWAP, ID, upPosition, handPosition, upBit, handBit))
+
+	# Make player draw the necessary number of cards.
+	# Returns number of cards drawn in order to send percepts.
+	def draw(self, player):
+		ID = player.getID()
+		hand = self.hands[ID]
+		cardsToDraw = min(3 - len(hand), self.deck.size())
+		if cardsToDraw > 0:
+			deckKeys = gb.ZONE_KEYS[gb.ZONE_DECK]
+			handKeys = self.handKeys[ID]
+			drawn = []
+			mask = 0
+			for i in range(0, cardsToDraw):
+				card = self.deck.pop()
+				drawn.append(card)
+				mask |= 1 << card.index
+				self.hash ^= deckKeys[card.index] ^ handKeys[card.index]
+			hand.extend(drawn)
+			self.deckMask &= ~mask
+			self.handMasks[ID] |= mask
+			if self.logging:
+				self.undoLog.append((gb.UNDO_DRAW, ID, drawn, mask))
+			return cardsToDraw
+		else:
+			return 0
+
+	# Reverts a single undo log entry. Entries hold the masks that moved
+	# and, like GameBoard's, the list positions the cards came from.
+	def undoEntry(self, entry):
+		kind = entry[0]
+		if kind == gb.UNDO_HAND_TO_PILE or kind == gb.UNDO_UP_TO_PILE or kind == gb.UNDO_DOWN_TO_PILE:
+			if kind == gb.UNDO_HAND_TO_PILE:
+				zones, masks = self.hands, self.handMasks
+			elif kind == gb.UNDO_UP_TO_PILE:
+				zones, masks = self.upCards, self.upMasks
+			else:
+				zones, masks = self.downCards, self.downMasks
+			zone = zones[entry[1]]
+			mask = 0
+			for position in reversed(entry[2]):
+				card = self.pile.pop()
+				zone.insert(position, card)
+				mask |= 1 << card.index
+			self.pileMask &= ~mask
+			masks[entry[1]] |= mask
+		elif kind == gb.UNDO_PICKUP:
+			hand = self.hands[entry[1]]
+			del hand[len(hand) - entry[2].size():]
+			self.handMasks[entry[1]] &= ~entry[3]
+			self.pile = entry[2]
+			self.pileMask = entry[3]
+		elif kind == gb.UNDO_CLEAR:
+			topCard = self.discard.pop()
+			for i in range(1, entry[1]):
+				self.pile.push(self.discard.pop())
+			self.pile.push(topCard)
+			self.discardMask &= ~entry[2]
+			self.pileMask = entry[2]
+		elif kind == gb.UNDO_CLEAR_THREES:
+			for i in range(0, entry[1]):
+				card = self.discard.pop()
+				self.pile.push(card)
+				self.discardMask &= ~(1 << card.index)
+				self.pileMask |= 1 << card.index
+		elif kind == gb.UNDO_SWAP:
+			ID = entry[1]
+			upSwap = self.hands[ID].pop()
+			handSwap = self.upCards[ID].pop()
+			self.hands[ID].insert(entry[3], handSwap)
+			self.upCards[ID].insert(entry[2], upSwap)
+			upBit = entry[4]
+			handBit = entry[5]
+			self.upMasks[ID] = (self.upMasks[ID] & ~handBit) | upBit
+			self.handMasks[ID] = (self.handMasks[ID] & ~upBit) | handBit
+		elif kind == gb.UNDO_DRAW:
+			hand = self.hands[entry[1]]
+			del hand[len(hand) - len(entry[2]):]
+			for card in reversed(entry[2]):
+				self.deck.push(card)
+			self.deckMask |= entry[3]
+			self.handMasks[entry[1]] &= ~entry[3]
+		else:
+			gb.GameBoard.undoEntry(self, entry)
+
+# The BitBoard counterpart of GameBoard.HandView, answering rank queries
+# with masks instead of a RankIndex. Cards come back in hand order.
+class BitHandView:
+
+	def __init__(self, bitBoard, agentID):
+		self.bitBoard = bitBoard
+		self.agentID = agentID
+
+	def handMask(self):
+		return self.bitBoard.handMasks[self.agentID]
+
+	def playableHandMask(self):
+		return self.bitBoard.handMasks[self.agentID] & self.bitBoard.playableMask()
+
+	# Returns True iff the hand contains a card of rank.
+	def containsRank(self, rank):
+		return not self.handMask() & RANK_MASKS[rank] == 0
+
+	# Returns True iff the hand contains a playable card of rank.
+	def containsPlayableRank(self, rank):
+		return not self.playableHandMask() & RANK_MASKS[rank] == 0
+
+	# Returns a list of all hand cards of rank.
+	def getAllOfRank(self, rank):
+		return self.bitBoard.filterCards(self.bitBoard.hands[self.agentID], self.handMask() & RANK_MASKS[rank])
+
+	# Returns a list containing a single hand card of rank.
+	def getOneOfRank(self, rank):
+		return self.getAllOfRank(rank)[:1]
+
+	# Returns the numerically lowest playable rank, or None.
+	def lowestPlayableRank(self):
+		playable = self.playableHandMask()
+		for rank in range(2, 15):
+			if playable & RANK_MASKS[rank]:
+				return rank
+		return None
+
+	# Returns the least valuable playable rank, or None.
+	def worstPlayableRank(self):
+		playable = self.playableHandMask()
+		for rank in util.VALUE_ORDER:
+			if playable & RANK_MASKS[rank]:
+				return rank
+		return None
+
+	# Returns the most valuable rank in the hand, or None.
+	def bestRank(self):
+		hand = self.handMask()
+		for rank in reversed(util.VALUE_ORDER):
+			if hand & RANK_MASKS[rank]:
+				return rank
+		return None
+
+	# Returns True iff every playable card is wild.
+	def onlyWilds(self):
+		return self.playableHandMask() & NON_WILD_MASK == 0
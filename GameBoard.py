@@ -1,14 +1,50 @@
 import util
 import random
+import sys
+
+# Kinds of entries in the GameBoard undo log.
+UNDO_HAND_TO_PILE = 0
+UNDO_UP_TO_PILE = 1
+UNDO_DOWN_TO_PILE = 2
+UNDO_PICKUP = 3
+UNDO_CLEAR = 4
+UNDO_CLEAR_THREES = 5
+UNDO_SWAP = 6
+UNDO_DRAW = 7
+UNDO_HASH = 8
+
+# Zobrist keys for the position hash. Every card has a random 64-bit key per
+# zone; the hash of a position is the XOR of the keys of each card in its zone,
+# plus keys for the top card of the pile, the length of the run on top of the
+# pile (4 or more counted as 4), whose turn it is and the pregame. Keys come
+# from a fixed seed so hashes are the same in every process.
+ZONE_DECK = 0
+ZONE_PILE = 1
+ZONE_DISCARD = 2
+MAX_SEATS = 4
+
+# Returns the zone numbers of the hand, up cards and down cards of seat.
+def seatZones(seat):
+	return (3 + 3*seat, 4 + 3*seat, 5 + 3*seat)
+
+keyGenerator = random.Random(52)
+ZONE_KEYS = [[keyGenerator.getrandbits(64) for index in range(0, 52)] for zone in range(0, 3 + 3*MAX_SEATS)]
+TOP_KEYS = [keyGenerator.getrandbits(64) for index in range(0, 52)]
+RUN_KEYS = [0] + [keyGenerator.getrandbits(64) for length in range(1, 5)]
+TURN_KEYS = [keyGenerator.getrandbits(64) for seat in range(0, MAX_SEATS)]
+PREGAME_KEY = keyGenerator.getrandbits(64)
+del keyGenerator
 
 # Represents a configuration of the cards on the table and in players' hands.
 class GameBoard:
 
 	# Initializes and shuffles the deck, deals cards to 
 	# players. Sets up all of the appropriate data
-	# structures.
-	def __init__(self, players):
-		self.pile = util.Stack()
+	# structures. rng is the game's random source. If deckOrder
+	# is given, it is used as the shuffled deck instead (the
+	# last card is on top).
+	def __init__(self, players, rng=random, deckOrder=None):
+		self.pile = util.PileStack()
 		self.deck = util.Stack()
 		self.discard = util.Stack()
 		self.players = players
@@ -18,14 +54,19 @@ class GameBoard:
 		# Dicts with mappings agentID:list
 		self.upCards = dict()		
 		self.downCards = dict()
+		# Dict with mappings agentID:RankIndex of the hand
+		self.handIndexes = dict()
+		# Mutations made through apply() are logged here so undo() can revert them.
+		self.undoLog = []
+		self.logging = False
 
 		# Initialize and shuffle the deck
-		tempDeck = []
-		for suit in ["C", "S", "D", "H"]:
-			for rank in range(2, 15):
-				newCard = util.Card(rank, suit)
-				tempDeck.append(newCard)
-		random.shuffle(tempDeck)
+		if deckOrder == None:
+			tempDeck = list(util.CARDS)
+			rng.shuffle(tempDeck)
+		else:
+			tempDeck = list(deckOrder)
+		self.deckOrder = tuple(tempDeck)
 		self.deck.pushList(tempDeck)	
 
 		for player in self.players:
@@ -44,6 +85,9 @@ class GameBoard:
 			# Draw a 3-card hand for the player.
 			for i in range(1, 4):
 				self.hands[ID].append(self.deck.pop())
+			self.handIndexes[ID] = util.RankIndex(self.hands[ID])
+
+		self.initHash()
 
 	#######################################################
 	#######################################################
@@ -102,28 +146,12 @@ class GameBoard:
 	#######################################################
 	#######################################################
 
-	#CHANGES  -  areEqual and inList
-
+	# Cards are interned, so equal cards are the same object.
 	def areEqual(self, card1, card2):
-		card1rank = card1.getRank()
-		card2rank = card2.getRank()
-
-		if card1rank == "A": card1rank = 14
-		if card1rank == "J": card1rank = 11
-		if card1rank == "Q": card1rank = 12
-		if card1rank == "K": card1rank = 13
-
-		if card2rank == "A": card2rank = 14
-		if card2rank == "J": card2rank = 11
-		if card2rank == "Q": card2rank = 12
-		if card2rank == "K": card2rank = 13
-
-		return (card1rank == card2rank and card1.getSuit() == card2.getSuit())
+		return card1 is card2
 
 	def inList(self, card, cardList):
-		for listCard in cardList:
-			if self.areEqual(card, listCard): return True
-		return False
+		return card in cardList
 
 	# Returns True iff game is over.
 	def isTerminal(self):
@@ -140,25 +168,9 @@ class GameBoard:
 		return self.hands[agentID] == [] and not self.upCards[agentID] == []
 
 	# Returns true iff the top four cards of the pile are the same.
+	# The pile tracks the run of equal ranks on top, so this is a field read.
 	def topFourSame(self):
-		if self.pile.size() < 4:
-			return False
-		output = True
-		temp = util.Stack()
-		card = self.pile.pop()
-		temp.push(card)
-		oldRank = card.getRank()
-		for i in range(1, 4):
-			card = self.pile.pop()
-			temp.push(card)
-			rank = card.getRank()
-			if not rank == oldRank:
-				output = False
-				break
-		while not temp.isEmpty():
-			card = temp.pop()
-			self.pile.push(card)
-		return output
+		return self.pile.topRunLength() >= 4
 
 	# # Returns True iff player can legally make swap
 	# def isLegalSwap(self, upCard, handCard, player):
@@ -253,10 +265,22 @@ class GameBoard:
 	def viewUpCards(self, player):
 		return list(self.upCards[player.getID()])
 
+	# Returns the number of cards in player's hand.
+	def getHandSize(self, player):
+		return len(self.hands[player.getID()])
+
 	# Returns a copy of the player's down cards.
 	def viewDownCards(self, player):
 		return list(self.downCards[player.getID()])
 
+	# Returns the order of the deck before the deal (the last card is on top).
+	def getDeckOrder(self):
+		return self.deckOrder
+
+	# Returns a live HandView of player's hand.
+	def getHandView(self, player):
+		return HandView(self, self.handIndexes[player.getID()])
+
 	# Returns a list of legal hand cards for an agent. [] implies no legal hand cards.
 	def getPlayableHandCards(self, player):
 		playableCards = []
@@ -275,6 +299,81 @@ class GameBoard:
 				playableCards.append(card)
 		return playableCards
 
+	#######################################################
+	#######################################################
+	# POSITION HASH METHODS:
+	# The GameBoard keeps a 64-bit Zobrist hash of the position,
+	# updated in O(1) per card moved. Used to spot repeated
+	# positions and as a key for transposition tables.
+	#######################################################
+	#######################################################
+
+	# Sets up the per-seat key rows and computes the hash of the deal.
+	def initHash(self):
+		self.handKeys = dict()
+		self.upKeys = dict()
+		self.downKeys = dict()
+		self.seats = dict()
+		for seat in range(0, len(self.players)):
+			ID = self.players[seat].getID()
+			zones = seatZones(seat)
+			self.seats[ID] = seat
+			self.handKeys[ID] = ZONE_KEYS[zones[0]]
+			self.upKeys[ID] = ZONE_KEYS[zones[1]]
+			self.downKeys[ID] = ZONE_KEYS[zones[2]]
+		self.turnID = None
+		self.pregame = True
+		self.pileTopKey = self.pileKey()
+		self.hash = self.computeHash()
+
+	# Returns the position hash.
+	def getHash(self):
+		return self.hash
+
+	# Computes the position hash from scratch.
+	def computeHash(self):
+		output = 0
+		for zone, cards in [(ZONE_DECK, self.deck.list), (ZONE_PILE, self.pile.list), (ZONE_DISCARD, self.discard.list)]:
+			for card in cards:
+				output ^= ZONE_KEYS[zone][card.index]
+		for player in self.players:
+			ID = player.getID()
+			for keys, cards in [(self.handKeys[ID], self.viewHand(player)), (self.upKeys[ID], self.viewUpCards(player)), (self.downKeys[ID], self.viewDownCards(player))]:
+				for card in cards:
+					output ^= keys[card.index]
+		output ^= self.pileKey()
+		if not self.turnID == None:
+			output ^= TURN_KEYS[self.seats[self.turnID]]
+		if self.pregame:
+			output ^= PREGAME_KEY
+		return output
+
+	# Returns the key for the top card of the pile and the run on top.
+	def pileKey(self):
+		topCard = self.pile.peek()
+		if topCard == None:
+			return 0
+		return TOP_KEYS[topCard.index] ^ RUN_KEYS[min(self.pile.topRunLength(), 4)]
+
+	# Updates the hash after the top of the pile changed.
+	def rehashPileTop(self):
+		newKey = self.pileKey()
+		self.hash ^= self.pileTopKey ^ newKey
+		self.pileTopKey = newKey
+
+	# Records in the hash that it is agentID's turn.
+	def setTurn(self, agentID):
+		if not self.turnID == None:
+			self.hash ^= TURN_KEYS[self.seats[self.turnID]]
+		self.turnID = agentID
+		self.hash ^= TURN_KEYS[self.seats[agentID]]
+
+	# Records in the hash whether the game is still in the pregame.
+	def setPregame(self, pregame):
+		if not pregame == self.pregame:
+			self.hash ^= PREGAME_KEY
+			self.pregame = pregame
+
 	#######################################################
 	#######################################################
 	# MUTATOR METHODS:
@@ -285,9 +384,21 @@ class GameBoard:
 	# Places cards from player's hand into the pile.
 	def handToPile(self, player, cardList):
 		hand = self.hands[player.getID()]
+		handIndex = self.handIndexes[player.getID()]
+		handKeys = self.handKeys[player.getID()]
+		# Logged first and filled in card by card, so a card missing
+		# from the hand leaves an entry that undoes the cards moved.
+		positions = []
+		if self.logging:
+			self.undoLog.append((UNDO_HAND_TO_PILE, player.getID(), positions))
 		for card in cardList:
-			hand.remove(card)
+			position = hand.index(card)
+			del hand[position]
+			handIndex.remove(card)
 			self.pile.push(card)
+			positions.append(position)
+			self.hash ^= handKeys[card.index] ^ ZONE_KEYS[ZONE_PILE][card.index]
+		self.rehashPileTop()
 
 		numDrawn = self.draw(player)
 		return numDrawn
@@ -295,41 +406,75 @@ class GameBoard:
 	# Places cards from the pile into player's hand.
 	def pileToHand(self, player):
 		hand = self.hands[player.getID()]
+		handIndex = self.handIndexes[player.getID()]
+		if self.logging:
+			self.undoLog.append((UNDO_PICKUP, player.getID(), self.pile.size()))
+		handKeys = self.handKeys[player.getID()]
 		while not self.pile.isEmpty():
 			card = self.pile.pop()
 			hand.append(card)
+			handIndex.add(card)
+			self.hash ^= ZONE_KEYS[ZONE_PILE][card.index] ^ handKeys[card.index]
+		self.rehashPileTop()
 
 	# Places cards from player's up cards into the pile.
 	def upCardsToPile(self, player, cardList):
 		upCards = self.upCards[player.getID()]
+		upKeys = self.upKeys[player.getID()]
+		# Logged first and filled in card by card, as in handToPile.
+		positions = []
+		if self.logging:
+			self.undoLog.append((UNDO_UP_TO_PILE, player.getID(), positions))
 		for card in cardList:
-			upCards.remove(card)
+			position = upCards.index(card)
+			del upCards[position]
 			self.pile.push(card)
+			positions.append(position)
+			self.hash ^= upKeys[card.index] ^ ZONE_KEYS[ZONE_PILE][card.index]
+		self.rehashPileTop()
 
 	# Places one of player's down cards on the pile.
 	def downCardToPile(self, player, card):
 		downCards = self.downCards[player.getID()]
-		downCards.remove(card)
+		position = downCards.index(card)
+		del downCards[position]
 		self.pile.push(card)
+		self.hash ^= self.downKeys[player.getID()][card.index] ^ ZONE_KEYS[ZONE_PILE][card.index]
+		self.rehashPileTop()
+		if self.logging:
+			self.undoLog.append((UNDO_DOWN_TO_PILE, player.getID(), position))
 
-	# Sends the pile to the discard pile.
+	# Sends the pile to the discard pile. Raises ValueError if the pile is empty.
 	def clearPile(self):
+		if self.pile.isEmpty():
+			raise ValueError("Cannot clear an empty pile")
+		if self.logging:
+			self.undoLog.append((UNDO_CLEAR, self.pile.size()))
 		topCard = self.pile.pop()
+		self.hash ^= ZONE_KEYS[ZONE_PILE][topCard.index] ^ ZONE_KEYS[ZONE_DISCARD][topCard.index]
 		while not self.pile.isEmpty():
 			card = self.pile.pop()
 			self.discard.push(card)
+			self.hash ^= ZONE_KEYS[ZONE_PILE][card.index] ^ ZONE_KEYS[ZONE_DISCARD][card.index]
 		self.discard.push(topCard)
+		self.rehashPileTop()
 
 	# Used to clear 3s from the top of the pile.
 	def clearThrees(self):
+		numCleared = 0
 		done = False
 		while not done:
 			topCard = self.pile.peek()
 			if not topCard == None and topCard.getRank() == 3:
 				self.pile.pop()
 				self.discard.push(topCard)
+				self.hash ^= ZONE_KEYS[ZONE_PILE][topCard.index] ^ ZONE_KEYS[ZONE_DISCARD][topCard.index]
+				numCleared += 1
 			else:
 				done = True
+		self.rehashPileTop()
+		if self.logging:
+			self.undoLog.append((UNDO_CLEAR_THREES, numCleared))
 
 	# Applies a swap, assuming it's legal.
 	def applySwap(self, swap, player):
@@ -339,26 +484,19 @@ class GameBoard:
 		upCards = self.upCards[ID]
 		hand = self.hands[ID]
 
-		for card in upCards:
-			if self.areEqual(upSwap, card):
-				upCards.remove(card)
-				hand.append(upSwap)
-				break
-		for card in hand:
-			if self.areEqual(card, handSwap):
-				hand.remove(card)
-				upCards.append(card)
-				break
-
-		"""
-		works for nonHuman agents because comapares object addresses
-
-		upCards.remove(upSwap)
+		# Both cards are found before anything moves.
+		upPosition = upCards.index(upSwap)
+		handPosition = hand.index(handSwap)
+		del upCards[upPosition]
 		hand.append(upSwap)
-		hand.remove(handSwap)
+		del hand[handPosition]
 		upCards.append(handSwap)
-
-		"""
+		self.handIndexes[ID].remove(handSwap)
+		self.handIndexes[ID].add(upSwap)
+		self.hash ^= self.upKeys[ID][upSwap.index] ^ self.handKeys[ID][upSwap.index]
+		self.hash ^= self.handKeys[ID][handSwap.index] ^ self.upKeys[ID][handSwap.index]
+		if self.logging:
+			self.undoLog.append((UNDO_SWAP, ID, upPosition, handPosition))
 
 	# Make player draw the necessary number of cards.
 	# Returns number of cards drawn in order to send percepts.
@@ -371,8 +509,159 @@ class GameBoard:
 			for i in range(0, cardsToDraw):
 				card = self.deck.pop()
 				hand.append(card)
+				self.handIndexes[player.getID()].add(card)
+				self.hash ^= ZONE_KEYS[ZONE_DECK][card.index] ^ self.handKeys[player.getID()][card.index]
+			if self.logging:
+				self.undoLog.append((UNDO_DRAW, player.getID(), cardsToDraw))
 			return cardsToDraw
 		else:
-			return 0 
+			return 0
+
+	#######################################################
+	#######################################################
+	# MAKE/UNMAKE METHODS:
+	# Let search agents try a move and take it back without
+	# copying the GameBoard. Every mutation made by apply()
+	# (including the draws and pile clears it causes) is
+	# recorded in a compact undo log.
+	#######################################################
+	#######################################################
 
-	
\ No newline at end of file
+	# Applies move and returns a token that undo() takes to revert it.
+	# Moves are tuples:
+	#   ("HAND", player, cardList)   ("UP", player, cardList)
+	#   ("DOWN", player, card)       ("PICKUP", player)
+	#   ("SWAP", player, swap)       ("DRAW", player)
+	#   ("CLEAR",)                   ("CLEARTHREES",)
+	# "HAND" draws afterwards, exactly like handToPile. Raises ValueError
+	# for an unknown kind of move. If the move raises, whatever it logged is
+	# undone before the error is passed on.
+	def apply(self, move):
+		token = len(self.undoLog)
+		self.undoLog.append((UNDO_HASH, self.hash, self.pileTopKey))
+		wasLogging = self.logging
+		self.logging = True
+		try:
+			kind = move[0]
+			if kind == "HAND":
+				self.handToPile(move[1], move[2])
+			elif kind == "UP":
+				self.upCardsToPile(move[1], move[2])
+			elif kind == "DOWN":
+				self.downCardToPile(move[1], move[2])
+			elif kind == "PICKUP":
+				self.pileToHand(move[1])
+			elif kind == "SWAP":
+				self.applySwap(move[2], move[1])
+			elif kind == "DRAW":
+				self.draw(move[1])
+			elif kind == "CLEAR":
+				self.clearPile()
+			elif kind == "CLEARTHREES":
+				self.clearThrees()
+			else:
+				raise ValueError("Unknown move kind: " + str(kind))
+		except:
+			error = sys.exc_info()
+			self.undo(token)
+			raise error[0], error[1], error[2]
+		finally:
+			self.logging = wasLogging
+		return token
+
+	# Reverts every mutation made since apply() returned token, newest first.
+	def undo(self, token):
+		while len(self.undoLog) > token:
+			self.undoEntry(self.undoLog.pop())
+
+	# Reverts a single undo log entry. The hash is not updated entry by
+	# entry; the UNDO_HASH entry apply() logs first restores it.
+	def undoEntry(self, entry):
+		kind = entry[0]
+		if kind == UNDO_HASH:
+			self.hash = entry[1]
+			self.pileTopKey = entry[2]
+		elif kind == UNDO_HAND_TO_PILE:
+			hand = self.hands[entry[1]]
+			for position in reversed(entry[2]):
+				hand.insert(position, self.pile.pop())
+			self.handIndexes[entry[1]].rebuild(hand)
+		elif kind == UNDO_UP_TO_PILE:
+			upCards = self.upCards[entry[1]]
+			for position in reversed(entry[2]):
+				upCards.insert(position, self.pile.pop())
+		elif kind == UNDO_DOWN_TO_PILE:
+			self.downCards[entry[1]].insert(entry[2], self.pile.pop())
+		elif kind == UNDO_PICKUP:
+			# The pile was appended to the hand top card first.
+			hand = self.hands[entry[1]]
+			handIndex = self.handIndexes[entry[1]]
+			for i in range(0, entry[2]):
+				card = hand.pop()
+				handIndex.remove(card)
+				self.pile.push(card)
+		elif kind == UNDO_CLEAR:
+			# clearPile moved the top card last, the rest from the top down.
+			numCards = entry[1]
+			topCard = self.discard.pop()
+			for i in range(1, numCards):
+				self.pile.push(self.discard.pop())
+			self.pile.push(topCard)
+		elif kind == UNDO_CLEAR_THREES:
+			for i in range(0, entry[1]):
+				self.pile.push(self.discard.pop())
+		elif kind == UNDO_SWAP:
+			ID = entry[1]
+			upSwap = self.hands[ID].pop()
+			handSwap = self.upCards[ID].pop()
+			self.hands[ID].insert(entry[3], handSwap)
+			self.upCards[ID].insert(entry[2], upSwap)
+			self.handIndexes[ID].rebuild(self.hands[ID])
+		elif kind == UNDO_DRAW:
+			hand = self.hands[entry[1]]
+			handIndex = self.handIndexes[entry[1]]
+			for i in range(0, entry[2]):
+				card = hand.pop()
+				handIndex.remove(card)
+				self.deck.push(card)
+
+# A read-only view of a player's hand, given to agents so they can ask about
+# ranks without rescanning their hand. Backed by the RankIndex the GameBoard
+# keeps up to date; playable queries are answered against the current pile.
+class HandView:
+
+	def __init__(self, gameBoard, rankIndex):
+		self.gameBoard = gameBoard
+		self.rankIndex = rankIndex
+
+	# Returns True iff the hand contains a card of rank.
+	def containsRank(self, rank):
+		return self.rankIndex.containsRank(rank)
+
+	# Returns True iff the hand contains a playable card of rank.
+	def containsPlayableRank(self, rank):
+		return self.rankIndex.containsPlayableRank(rank, self.gameBoard.peekPile())
+
+	# Returns a list of all hand cards of rank.
+	def getAllOfRank(self, rank):
+		return self.rankIndex.getAllOfRank(rank)
+
+	# Returns a list containing a single hand card of rank.
+	def getOneOfRank(self, rank):
+		return self.rankIndex.getOneOfRank(rank)
+
+	# Returns the numerically lowest playable rank, or None.
+	def lowestPlayableRank(self):
+		return self.rankIndex.lowestPlayableRank(self.gameBoard.peekPile())
+
+	# Returns the least valuable playable rank, or None.
+	def worstPlayableRank(self):
+		return self.rankIndex.worstPlayableRank(self.gameBoard.peekPile())
+
+	# Returns the most valuable rank in the hand, or None.
+	def bestRank(self):
+		return self.rankIndex.bestRank()
+
+	# Returns True iff every playable card is wild.
+	def onlyWilds(self):
+		return self.rankIndex.onlyWilds(self.gameBoard.peekPile())
@@ -1,6 +1,12 @@
-import util, random, sys
+import util, random, sys, logging
 import agentState as st
 import featureExtractor as fe
+try:
+	import numpy as np
+except ImportError:
+	np = None	# The Q-learner falls back to dict weights and one action at a time.
+
+log = logging.getLogger(__name__)	# The Q-learner logs its legal actions at DEBUG.
 
 #######################################################
 #######################################################
@@ -19,6 +25,7 @@ class Agent:
 	def __init__(self, agentID):
 		self.agentID = agentID
 		self.type = "ABSTRACTAGENT"
+		self.handView = None
 
 	def getID(self):
 		return self.agentID
@@ -50,12 +57,20 @@ class Agent:
 	def updateKnowledge(self, perceptType, agentID=None, cardList=None, handCard=None):
 		return
 
+	# Stores a live view of this agent's hand, kept up to date by the GameBoard.
+	# Agents may use it to answer rank questions without rescanning their hand.
+	def setHandView(self, handView):
+		self.handView = handView
+
 # An agent that chooses actions randomly.
 class RandomAgent:
 
-	def __init__(self, agentID):
+	# rng is the random source: the random module or the game's random.Random.
+	def __init__(self, agentID, rng=random):
 		self.agentID = agentID
 		self.type = "RandomAgent"
+		self.rng = rng
+		self.handView = None
 
 	def getID(self):
 		return self.agentID
@@ -70,7 +85,7 @@ class RandomAgent:
 		if playableCards == []:
 			return []
 		else:
-			rank = random.choice(playableCards).getRank()
+			rank = self.rng.choice(playableCards).getRank()
 			cardsToPlay = self.getSomeOfRank(rank, playableCards)
 			return cardsToPlay
 
@@ -81,7 +96,7 @@ class RandomAgent:
 		if playableCards == []:
 			return []
 		else:
-			rank = random.choice(playableCards).getRank()
+			rank = self.rng.choice(playableCards).getRank()
 			cardsToPlay = self.getSomeOfRank(rank, playableCards)
 			return cardsToPlay
 
@@ -95,22 +110,26 @@ class RandomAgent:
 	# chooseHandCard.
 	def chooseSwap(self, hand, upCards, playableCards):
 		# Randomly choose between swapping and putting down.
-		if random.choice([0, 1]) == 1:
+		if self.rng.choice([0, 1]) == 1:
 			# Return a valid first play.
-			rank = random.choice(playableCards).getRank()
+			rank = self.rng.choice(playableCards).getRank()
 			cardsToPlay = self.getSomeOfRank(rank, playableCards)
 			return (None, cardsToPlay)
 
 		else:
 			# Return a valid swap.
-			upSwap = random.choice(upCards)
-			handSwap = random.choice(hand)
+			upSwap = self.rng.choice(upCards)
+			handSwap = self.rng.choice(hand)
 			return (upSwap, handSwap)
 
 	# No knowledge is stored, so method is trivial.
 	def updateKnowledge(self, perceptType, agentID=None, cardList=None, handCard=None):
 		return
 
+	# Stores a live view of this agent's hand, kept up to date by the GameBoard.
+	def setHandView(self, handView):
+		self.handView = handView
+
         #######################################################
         #######################################################
 	# HELPER METHODS
@@ -126,7 +145,7 @@ class RandomAgent:
 			if output == [] and card.getRank() == rank:
 				output.append(card)
 			elif not output == [] and card.getRank() == rank:
-				choice = random.choice([0, 1])
+				choice = self.rng.choice([0, 1])
 				if choice == 1:
 					output.append(card)
 		return output
@@ -137,6 +156,7 @@ class GreedyAgent:
 	def __init__(self, agentID):
 		self.agentID = agentID
 		self.type = "GreedyAgent"
+		self.handView = None
 
 	def getID(self):
 		return self.agentID
@@ -149,7 +169,7 @@ class GreedyAgent:
 		if playableCards == []:
 			return []
 		else:
-			return self.worstCardsInList(playableCards)
+			return self.worstPlayableHandCards(playableCards)
 
 	# Choose all cards of the lowest playable rank in upCards.
 	def chooseUpCard(self, upCards, playableCards):
@@ -164,11 +184,11 @@ class GreedyAgent:
 	# Swap best card in hand with worst card in up cards until
 	# there are no more productive swaps.
 	def chooseSwap(self, hand, upCards, playableCards):
-		bestHandCard = self.bestCardInList(hand)
+		bestHandCard = self.bestHandCard(hand)
 		worstUpCard = self.worstCardInList(upCards)
 		# If there are no more productive swaps, play lowest card(s).
 		if not self.isBetterThan(bestHandCard, worstUpCard):
-			worstHandCards = self.worstCardsInList(playableCards)
+			worstHandCards = self.worstPlayableHandCards(playableCards)
 			return (None, worstHandCards)
 		
 		# Return a valid swap.
@@ -179,12 +199,28 @@ class GreedyAgent:
 	def updateKnowledge(self, perceptType, agentID=None, cardList=None, handCard=None):
 		return
 
+	# Stores a live view of this agent's hand, kept up to date by the GameBoard.
+	def setHandView(self, handView):
+		self.handView = handView
+
 	#######################################################
 	#######################################################
 	# HELPER METHODS
 	#######################################################
 	#######################################################
 
+	# Return one of the best cards in hand, from the hand view if there is one.
+	def bestHandCard(self, hand):
+		if self.handView == None:
+			return self.bestCardInList(hand)
+		return self.handView.getOneOfRank(self.handView.bestRank())[0]
+
+	# Returns the lowest valued playable hand cards, from the hand view if there is one.
+	def worstPlayableHandCards(self, playableCards):
+		if self.handView == None:
+			return self.worstCardsInList(playableCards)
+		return self.handView.getAllOfRank(self.handView.worstPlayableRank())
+
 	# Returns True iff card is more valuable than otherCard.
 	# Value order:
 	# 3 > 10 > 2 > A > K > ... > 4
@@ -249,6 +285,7 @@ class HeuristicAgent:
 		self.discardPileRep = []	# Internal representation of the discard pile.
 		self.opponentHandRep = []	# Internal representation of the opponent's hand.
 		self.deckSize = 52 - 18
+		self.handView = None
 
 	def getID(self):
 		return self.agentID
@@ -261,6 +298,10 @@ class HeuristicAgent:
 		if playableCards == []:
 			return []
 
+		# Answer the same heuristics from the hand view if there is one.
+		elif not self.handView == None:
+			return self.chooseFromHandView()
+
 		# If 7s and 6s are in hand and playable, play 7s first.
 		elif self.sevensRule(hand, playableCards):
 			return self.getAllOfRank(7, playableCards)
@@ -321,17 +362,21 @@ class HeuristicAgent:
 	# Swap best card in hand with worst card in up cards until
 	# there are no more productive swaps.
 	def chooseSwap(self, hand, upCards, playableCards):
-		bestHandCard = self.bestCardInList(hand)
+		bestHandCard = self.bestHandCard(hand)
 		worstUpCard = self.worstCardInList(upCards)
 		# If there are no more productive swaps, play lowest card(s).
 		if not self.isBetterThan(bestHandCard, worstUpCard):
-			worstHandCards = self.worstCardsInList(playableCards)
+			worstHandCards = self.worstPlayableHandCards(playableCards)
 			return (None, worstHandCards)
 		
 		# Return a valid swap.
 		else:
 			return (worstUpCard, bestHandCard)
 
+	# Stores a live view of this agent's hand, kept up to date by the GameBoard.
+	def setHandView(self, handView):
+		self.handView = handView
+
 	# Update knowledge based on percept.
 	# cardList only given on "PLAY" move.
 	# agentID only used on "PICKUP" and "PLAY".
@@ -374,6 +419,35 @@ class HeuristicAgent:
 	#######################################################
 	#######################################################
 
+	# chooseHandCard's heuristics, answered from the hand view.
+	def chooseFromHandView(self):
+		view = self.handView
+		# If 7s and 6s are in hand and 7s are playable, play 7s first.
+		if view.containsPlayableRank(7) and view.containsRank(6):
+			return view.getAllOfRank(7)
+
+		# If we can only play wilds, play one of the least valuable kind.
+		elif view.onlyWilds():
+			for rank in [2, 10, 3]:
+				if view.containsPlayableRank(rank):
+					return view.getOneOfRank(rank)
+
+		# Greedy case: play all of lowest playable rank.
+		else:
+			return view.getAllOfRank(view.worstPlayableRank())
+
+	# Return one of the best cards in hand, from the hand view if there is one.
+	def bestHandCard(self, hand):
+		if self.handView == None:
+			return self.bestCardInList(hand)
+		return self.handView.getOneOfRank(self.handView.bestRank())[0]
+
+	# Returns the lowest valued playable hand cards, from the hand view if there is one.
+	def worstPlayableHandCards(self, playableCards):
+		if self.handView == None:
+			return self.worstCardsInList(playableCards)
+		return self.handView.getAllOfRank(self.handView.worstPlayableRank())
+
 	# Return a list of all cards in playableCards of a certain rank.
 	def getAllOfRank(self, rank, playableCards):
 		output = []
@@ -425,7 +499,7 @@ class HeuristicAgent:
 	def worstCardInList(self, cardList):
 		worstCard = cardList[0]
 		for card in cardList:
-			if isBetterThan(worstCard, card):
+			if self.isBetterThan(worstCard, card):
 				worstCard = card
 		return worstCard
 
@@ -436,7 +510,7 @@ class HeuristicAgent:
 		for card in cardList:
 			if worstCard.getRank() == card.getRank():
 				worstCards.append(card)
-			elif isBetterThan(worstCard, card):
+			elif self.isBetterThan(worstCard, card):
 				worstCards = [card]
 				worstCard = card
 		return worstCards
@@ -504,6 +578,7 @@ class HumanAgent:
         self.pileRep = util.Stack()        # Internal representation of the pile.
         self.discardPileRep = {}        # Internal representation of the discard pile.
         self.opponentHandRep = {}        # Internal representation of the opponent's hand.
+        self.handView = None
 
     def getID(self):
         return self.agentID
@@ -639,6 +714,10 @@ class HumanAgent:
     def updateKnowledge(self, perceptType, agentID=None, cardList=None, handCard=None):
         return
 
+    # Stores a live view of this agent's hand, kept up to date by the GameBoard.
+    def setHandView(self, handView):
+        self.handView = handView
+
     # Accepts a tuple as input (rank, quantity) and converts it to an action list
     # returns an empty list if the cards are not available
     def getActionFromInput(self, playableCards, handToPlay):
@@ -657,20 +736,32 @@ class HumanAgent:
 class QLearningAgent:
 
 	# Initialize representations, set constants.
-	def __init__(self, agentID, initialWeights):
+	# initialWeights is a dict from features to weights (None for zeros).
+	# rng is the random source: the random module or the game's random.Random.
+	def __init__(self, agentID, initialWeights, rng=random):
 		self.agentID = agentID
 		self.type = "QLearningAgent"
+		self.rng = rng
 		self.pileRep = util.Stack()# Internal representation of the pile.
 		self.discardPileRep = []# Internal representation of the discard pile.
 		self.opponentHandRep = []# Internal representation of the opponent's hand.
 		self.deckSize = 52 - 18
-		self.weights = initialWeights # Stores weights.
+		self.setWeights(initialWeights) # Stores weights.
+		if not np == None:
+			# A feature matrix reused for every decision (grown when a state
+			# has more actions).
+			self.featureMatrix = np.zeros((64, fe.NUM_FEATURES))
 		self.epsilon = 0.2
 		self.alpha = 0.1
 		self.discount = 0.9
 		self.featExtractor = fe.featureExtractor()
 		self.inPreGame = True
 		self.gameEnded = False
+		self.handView = None
+		self.actionsState = None	# The state whose legal actions are in legalActions.
+		self.legalActions = []
+		self.transitions = None		# Recorded transitions, while recording.
+		self.lastFeatures = None	# Features of the last recorded decision's action.
 
 	def getID(self):
 		return self.agentID
@@ -678,8 +769,35 @@ class QLearningAgent:
 	def getType(self):
 		return self.type
 
+	# Returns a copy of the weights as a dict from features to weights.
 	def getWeights(self):
-		return self.weights
+		if not np == None:
+			return dict(zip(fe.FEATURES, self.weightVector.tolist()))
+		return dict(self.weights)
+
+	# Replaces the weights with a copy of weights, a dict from features to
+	# weights (None for zeros). With NumPy they are kept as a vector in
+	# fe.FEATURES order.
+	def setWeights(self, weights):
+		if weights == None:
+			weights = dict()
+		self.weights = dict([(feature, weights.get(feature, 0.0)) for feature in fe.FEATURES])
+		if not np == None:
+			self.weightVector = np.array([self.weights[feature] for feature in fe.FEATURES], dtype=float)
+
+	# Makes the agent read and update weightVector, a NumPy vector in
+	# fe.FEATURES order, in place: e.g. a view of weights shared between
+	# processes. Needs NumPy.
+	def useWeightVector(self, weightVector):
+		self.weightVector = weightVector
+
+	# Sets the probability of a random action.
+	def setEpsilon(self, epsilon):
+		self.epsilon = epsilon
+
+	# Sets the learning rate.
+	def setAlpha(self, alpha):
+		self.alpha = alpha
 
 	def setEnded(self, ended):
 		self.gameEnded = ended
@@ -740,6 +858,10 @@ class QLearningAgent:
 			print "INVALID PERCEPT TYPE"
 		return
 
+	# Stores a live view of this agent's hand, kept up to date by the GameBoard.
+	def setHandView(self, handView):
+		self.handView = handView
+
 
         #######################################################
         #######################################################
@@ -762,6 +884,8 @@ class QLearningAgent:
 			return 0.0 
 		elif actions == []:
 			return self.getQValue(state, [])
+		elif not np == None:
+			return float(self.getQValues(state, actions).max())
 		maxQValue = float("-inf")
 		# Find maximum QValue over all actions.
 		for action in actions:
@@ -784,6 +908,10 @@ class QLearningAgent:
 		# Terminal test.
 		if actions == [] or state.isTerminal():
 			return []
+		if not np == None:
+			QValues = self.getQValues(state, actions)
+			maximizingActions = [actions[i] for i in np.flatnonzero(QValues == QValues.max())]
+			return self.rng.choice(maximizingActions)
 		maxQValue = float("-inf")
 		# Keep a list of actions with equally maximal QValues. 
 		maximizingActions = []
@@ -798,7 +926,7 @@ class QLearningAgent:
 				maximizingActions.append(action)
 
 		# Choose randomly amongst tied actions. Random selection improves performance (value exploration).
-		return random.choice(maximizingActions)
+		return self.rng.choice(maximizingActions)
 
 	def getAction(self, state):
 		"""
@@ -814,20 +942,26 @@ class QLearningAgent:
 		legalActions = self.getLegalActions(state)
 		
 		if legalActions == []:
+			if not self.transitions == None:
+				self.recordDecision(state, [[]], [])
 			return []
 		
-		explore = util.flipCoin(self.epsilon)
+		explore = util.flipCoin(self.epsilon, self.rng)
 		if explore:
-			action = random.choice(legalActions)
-			return action
+			action = self.rng.choice(legalActions)
 		else:
-			return self.getPolicy(state)
+			action = self.getPolicy(state)
+		if not self.transitions == None:
+			self.recordDecision(state, legalActions, action)
+		return self.decodeAction(state, action)
 
 	def getQValue(self, state, action):
 		"""
 		Should return Q(state,action) = w * featureVector
 		where * is the dotProduct operator
 		"""
+		if not np == None:
+			return float(self.getQValues(state, [action])[0])
 
 	        # Dictionary of (feature->value) pairs.
 	        featureDict = self.featExtractor.getFeatures(state, action)
@@ -841,83 +975,162 @@ class QLearningAgent:
 
 		return QValue
 
+	# Returns a NumPy vector of the Q values of actions in state: the actions'
+	# features fill the rows of one matrix, which is multiplied by the
+	# weight vector.
+	def getQValues(self, state, actions):
+		return self.getFeatureMatrix(state, actions).dot(self.weightVector)
+
+	# Returns the features of actions in state as the rows of the reused
+	# NumPy feature matrix, valid until the next call.
+	def getFeatureMatrix(self, state, actions):
+		if len(actions) > len(self.featureMatrix):
+			self.featureMatrix = np.zeros((2*len(actions), fe.NUM_FEATURES))
+		return self.featExtractor.fillFeatureMatrix(state, actions, self.featureMatrix)
+
 	def update(self, state, action, nextState, reward):
 		"""
 		Should update your weights based on transition
 		"""
 
+		# Weight correction value.
+		correction = (reward + self.discount*self.getValue(nextState)) - self.getQValue(state, action)
+
+		# Update all weights: one vector operation, or one weight at a time.
+		if not np == None:
+			features = self.getFeatureMatrix(state, [action])[0]
+			self.weightVector += self.alpha*correction*features
+			return
+
 		# Dictionary of (feature->value) pairs.
 		featureDict = self.featExtractor.getFeatures(state, action)
 		# List of features (keys)
 		featureVector = featureDict.keys()
-
-		# Weight correction value.
-		print "Reward: " + str(reward)
-		print "Gamma: " + str(self.discount)
-		print "Next State Value: " + str(self.getValue(nextState))
-		print "Old State Value: " + str(self.getQValue(state, action))
-		correction = (reward + self.discount*self.getValue(nextState)) - self.getQValue(state, action)
-		print "Correction: " + str(correction)
-
-		# Update all weights.
 		for feature in featureVector:
 			self.weights[feature] += self.alpha*correction*featureDict[feature]
 
-	# Returns a list of lists, each inner list representing a legal action (swaps included).
+	# Updates the weights from a transition given as feature vectors (lists
+	# in fe.FEATURES order), as update does from states: the features of the
+	# action taken, those of every legal action in the next state ([] if the
+	# game ended) and the reward. Lets a learner train on transitions
+	# recorded by other agents, e.g. in other processes.
+	def learn(self, features, nextFeatureRows, reward):
+		if not np == None:
+			features = np.asarray(features, dtype=float)
+			nextValue = 0.0
+			if not nextFeatureRows == []:
+				nextValue = np.dot(nextFeatureRows, self.weightVector).max()
+			correction = reward + self.discount*nextValue - features.dot(self.weightVector)
+			self.weightVector += self.alpha*correction*features
+			return
+
+		weights = [self.weights[feature] for feature in fe.FEATURES]
+		nextValue = 0.0
+		if not nextFeatureRows == []:
+			nextValue = max([sum([w*x for w, x in zip(weights, row)]) for row in nextFeatureRows])
+		correction = reward + self.discount*nextValue - sum([w*x for w, x in zip(weights, features)])
+		for i in range(0, fe.NUM_FEATURES):
+			self.weights[fe.FEATURES[i]] += self.alpha*correction*features[i]
+
+	# Updates the weights from a minibatch of transitions sampled from a
+	# replayBuffer.ReplayBuffer, in one vector step along the mean of the
+	# transitions' corrections times their features. Needs NumPy.
+	def learnBatch(self, features, rewards, nextStateFeatures, nextActionRanges, terminals):
+		weights = self.weightVector
+		actionWeight = weights[fe.NUM_STATE_FEATURES]
+		# The best next action has the least or greatest action feature.
+		nextValues = nextStateFeatures.dot(weights[:fe.NUM_STATE_FEATURES]) + np.maximum(actionWeight*nextActionRanges[:, 0], actionWeight*nextActionRanges[:, 1])
+		nextValues[terminals] = 0.0
+		corrections = rewards + self.discount*nextValues - features.dot(weights)
+		self.weightVector += self.alpha*corrections.dot(features)/len(rewards)
+
+	#######################################################
+	#######################################################
+	# TRANSITION RECORDING
+	# While recording, every decision completes the
+	# transition from the previous one (reward 0), and
+	# endEpisode completes the last with the game's reward.
+	#######################################################
+	#######################################################
+
+	# Starts recording transitions, discarding any recorded before.
+	def startRecording(self):
+		self.transitions = []
+		self.lastFeatures = None
+
+	# Records a decision: the features of every legal action (actions) and
+	# of the action chosen.
+	def recordDecision(self, state, actions, action):
+		featureRows = self.getFeatureRows(state, actions)
+		if not self.lastFeatures == None:
+			self.transitions.append((self.lastFeatures, featureRows, 0))
+		self.lastFeatures = featureRows[actions.index(action)]
+
+	# Completes the last transition with the game's reward: 1 for a win, -1
+	# for a loss and 0 for a draw.
+	def endEpisode(self, reward):
+		if not self.lastFeatures == None:
+			self.transitions.append((self.lastFeatures, [], reward))
+		self.lastFeatures = None
+
+	# Returns the recorded transitions, (features, nextFeatureRows, reward)
+	# as taken by learn.
+	def getTransitions(self):
+		return self.transitions
+
+	# Returns the feature vectors of actions in state as lists.
+	def getFeatureRows(self, state, actions):
+		if not np == None:
+			return self.getFeatureMatrix(state, actions).tolist()
+		return self.featExtractor.getFeatureRows(state, actions)
+
+	# Returns the legal actions of state, encoded compactly: a play is
+	# (rank, count), count playable cards of rank, and a swap is (upCard,
+	# handCard). decodeAction turns an action into the move the game takes.
+	# The list is kept for the last state asked about, so the several calls
+	# made for one decision enumerate it once.
 	def getLegalActions(self, state):
-		hand = state.getHand()
-		upCards = state.getUpCards()
-		playableCards = state.getPlayableCards()
+		if state is self.actionsState:
+			return self.legalActions
 		actions = []
 
 		if self.inPreGame == True:
 			# Compile list of swaps.
-			for handCard in hand:
-				for upCard in upCards:
-					swap = (upCard, handCard)
-					actions.append(swap)
-
-		# Compile list of first plays and turns.
-		listsOfRanks = dict()
+			for handCard in state.getHand():
+				for upCard in state.getUpCards():
+					actions.append((upCard, handCard))
+
+		# Compile list of first plays and turns: one to all cards of each rank.
+		rankCounts = [0]*15
+		for card in state.getPlayableCards():
+			rankCounts[card.rank] += 1
 		for rank in range(2, 15):
-			listsOfRanks[rank] = []
-			for card in playableCards:
-				rank = card.getRank()
-				listsOfRanks[rank].append(card)
-
-		for rank in listsOfRanks.keys():
-			rankList = listsOfRanks[rank]
-			for index in range(0, len(rankList)):
-				subsetList = []
-				for i in range(0, index+1):
-					subsetList.append(rankList[i])
-					if self.inPreGame:
-						actions.append((None, subsetList))
-					else:
-						actions.append(subsetList)
-
-		output = "LEGAL ACTIONS: {"
-		for action in actions:
-			if isinstance(action, tuple):
-				output += "("
-				if action[0] == None: 
-					output += "None, ["
-					for card in action[1]:
-						output += card.toString() + ", "
-						output += "]"
-					else: 
-						output += action[0].toString() + ", " + action[1].toString()
-						output += ")"
-				else:
-					output += "["
-					for card in action:
-						output += card.toString() + ", "
-						output += "]"
-						output += ")"
-						output += "}"
-		print output
+			for count in range(1, rankCounts[rank] + 1):
+				actions.append((rank, count))
 
+		if log.isEnabledFor(logging.DEBUG):
+			log.debug("Legal actions: " + ", ".join([self.describeAction(action) for action in actions]))
+		self.actionsState = state
+		self.legalActions = actions
 		return actions
 
+	# Returns the move for an action of getLegalActions in state: a list of
+	# cards to play (None and the list in the pregame), a swap, or [] to
+	# pick up the pile.
+	def decodeAction(self, state, action):
+		if action == [] or not isinstance(action[0], int):
+			return action
+		rank, count = action
+		cardList = [card for card in state.getPlayableCards() if card.rank == rank][:count]
+		if self.inPreGame:
+			return (None, cardList)
+		return cardList
+
+	# Returns a readable form of an action of getLegalActions, for debugging.
+	def describeAction(self, action):
+		if isinstance(action[0], int):
+			return str(action[1]) + "x" + str(action[0])
+		return "swap " + action[0].toString() + " for " + action[1].toString()
+
 	def constructState(self, hand, upCards, playableCards, isTerminal):
 		return st.State(hand, upCards, playableCards, self.opponentHandRep, self.pileRep, self.discardPileRep, self.deckSize, isTerminal)
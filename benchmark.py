@@ -0,0 +1,397 @@
+import util
+import agents
+import game as g
+import GameBoard as gb
+import BitBoard as bb
+import experiment as ex
+import random
+import time
+import timeit
+import json
+import sys
+import platform
+import argparse
+
+#######################################################
+#######################################################
+# benchmark.py
+#
+# Timing comparisons for the hot paths of the game, and a
+# suite covering cards, boards, agent decisions and whole
+# games. The suite writes its results as JSON and can
+# compare them against a stored baseline.
+# Run with: python benchmark.py [--quick] [--output FILE]
+#                               [--baseline FILE]
+#######################################################
+#######################################################
+
+AGENT_TYPES = ["RANDOM", "GREEDY", "HEURISTIC", "QLEARNER"]
+BOARD_TYPES = [gb.GameBoard, bb.BitBoard]
+TOLERANCE = 0.10	# Default relative slowdown counted as a regression.
+GAME_TOLERANCE = 0.25	# Least slowdown counted for whole games, whose times vary more.
+
+# The original topFourSame: pops four cards into a temporary
+# Stack, compares their ranks and pushes them back.
+def legacyTopFourSame(pile):
+	if pile.size() < 4:
+		return False
+	output = True
+	temp = util.Stack()
+	card = pile.pop()
+	temp.push(card)
+	oldRank = card.getRank()
+	for i in range(1, 4):
+		card = pile.pop()
+		temp.push(card)
+		rank = card.getRank()
+		if not rank == oldRank:
+			output = False
+			break
+	while not temp.isEmpty():
+		card = temp.pop()
+		pile.push(card)
+	return output
+
+# topFourSame on a PileStack, which tracks the run on top.
+def trackedTopFourSame(pile):
+	return pile.topRunLength() >= 4
+
+# Builds a list of pile operations resembling a long game: each entry is a
+# card to push, or None for a pickup of the whole pile. Cards are drawn from
+# a shuffled deck that is refilled as it runs out, so runs of equal ranks
+# and four-of-a-kinds happen at their natural rate.
+def pileTrace(numTurns, seed):
+	rng = random.Random(seed)
+	trace = []
+	source = []
+	for i in range(0, numTurns):
+		if rng.random() < 0.1:
+			trace.append(None)
+			continue
+		if source == []:
+			source = list(util.CARDS)
+			rng.shuffle(source)
+		trace.append(source.pop())
+	return trace
+
+# Replays trace on pile the way Game.takeTurn drives it: after every play,
+# a 10 or four of a kind clears the pile. Returns the number of clears.
+def runTrace(trace, pile, topFourSame):
+	clears = 0
+	for card in trace:
+		if card == None:
+			while not pile.isEmpty():
+				pile.pop()
+		else:
+			pile.push(card)
+			if card.getRank() == 10 or topFourSame(pile):
+				while not pile.isEmpty():
+					pile.pop()
+				clears += 1
+	return clears
+
+# Returns the best of repeats wall-clock times for running trace.
+def timeTrace(trace, makePile, topFourSame, repeats):
+	best = float("inf")
+	for i in range(0, repeats):
+		pile = makePile()
+		start = time.time()
+		runTrace(trace, pile, topFourSame)
+		best = min(best, time.time() - start)
+	return best
+
+# Compares the original pop/push topFourSame with the run-tracking PileStack.
+def benchmarkTopFourSame(numTurns=200000, repeats=5, seed=0):
+	trace = pileTrace(numTurns, seed)
+	legacyClears = runTrace(trace, util.Stack(), legacyTopFourSame)
+	trackedClears = runTrace(trace, util.PileStack(), trackedTopFourSame)
+	if not legacyClears == trackedClears:
+		print "MISMATCH: " + str(legacyClears) + " vs. " + str(trackedClears) + " clears"
+
+	legacyTime = timeTrace(trace, util.Stack, legacyTopFourSame, repeats)
+	trackedTime = timeTrace(trace, util.PileStack, trackedTopFourSame, repeats)
+	print "topFourSame over " + str(numTurns) + " pile operations (" + str(trackedClears) + " clears):"
+	print "  pop/push:     " + str(round(legacyTime, 4)) + "s"
+	print "  run tracking: " + str(round(trackedTime, 4)) + "s"
+	print "  speedup:      " + str(round(legacyTime / trackedTime, 2)) + "x"
+
+#######################################################
+#######################################################
+# SUITE:
+# Every benchmark adds results to a dict from name to
+# {"value": ..., "unit": ..., "higherIsBetter": ...}.
+#######################################################
+#######################################################
+
+# Returns the best of repeats average times per call, in seconds, of calling
+# function number times.
+def bestTime(function, number, repeats):
+	timer = timeit.default_timer
+	best = float("inf")
+	for r in range(0, repeats):
+		start = timer()
+		for i in xrange(0, number):
+			function()
+		best = min(best, (timer() - start)/number)
+	return best
+
+# Adds a time per operation, in nanoseconds, to results.
+def addTime(results, name, seconds):
+	results[name] = {"value": seconds*1e9, "unit": "ns/op", "higherIsBetter": False}
+
+# Adds a rate to results.
+def addRate(results, name, rate, unit):
+	results[name] = {"value": rate, "unit": unit, "higherIsBetter": True}
+
+# Adds a failed benchmark to results, so a comparison reports it instead of
+# silently missing it.
+def addError(results, name, error):
+	results[name] = {"value": None, "unit": None, "higherIsBetter": None, "error": type(error).__name__ + ": " + str(error)}
+
+# Discards everything written to it; used to keep agents' debugging output
+# out of the timings' terminal.
+class NullWriter:
+
+	def write(self, text):
+		return
+
+	def flush(self):
+		return
+
+# Calls function with standard output discarded and returns its result.
+def quietly(function):
+	stdout = sys.stdout
+	sys.stdout = NullWriter()
+	try:
+		return function()
+	finally:
+		sys.stdout = stdout
+
+# Returns boards from the middle of seeded GREEDY vs. RANDOM games: each game
+# is stopped after a random number of turns.
+def sampleBoards(boardType, numBoards, seed):
+	rng = random.Random(seed)
+	boards = []
+	for i in range(0, numBoards):
+		game = g.Game("GREEDY", "RANDOM", None, boardType, None, util.gameRandom(seed, i))
+		for turn in range(0, rng.randint(5, 60)):
+			if game.isEnded():
+				break
+			game.takeTurn()
+		boards.append(game.getGameBoard())
+	return boards
+
+# Times Card.isPlayableOn over every (card, pile card) pair, the empty pile included.
+def benchmarkCards(results, repeats):
+	pairs = [(card, other) for card in util.CARDS for other in util.CARDS + [None]]
+	def run():
+		for card, other in pairs:
+			card.isPlayableOn(other)
+	addTime(results, "card.isPlayableOn", bestTime(run, 20, repeats)/len(pairs))
+
+# Times Stack push, pop and peek on a 52 card stack, per operation.
+def benchmarkStack(results, repeats):
+	cards = list(util.CARDS)
+	def run():
+		stack = util.Stack()
+		for card in cards:
+			stack.push(card)
+		while not stack.isEmpty():
+			stack.peek()
+			stack.pop()
+	addTime(results, "stack.push+peek+pop", bestTime(run, 50, repeats)/len(cards))
+	def runList():
+		stack = util.Stack()
+		stack.pushList(cards)
+	addTime(results, "stack.pushList52", bestTime(runList, 200, repeats))
+
+# Times the board queries and pile operations on mid-game boards of each engine.
+def benchmarkBoards(results, numBoards, repeats, seed):
+	for boardType in BOARD_TYPES:
+		name = boardType.__name__
+		boards = sampleBoards(boardType, numBoards, seed)
+		states = [(board, player) for board in boards for player in board.players]
+
+		def playable():
+			for board, player in states:
+				board.getPlayableHandCards(player)
+		addTime(results, name + ".getPlayableHandCards", bestTime(playable, 20, repeats)/len(states))
+
+		def fourSame():
+			for board in boards:
+				board.topFourSame()
+		addTime(results, name + ".topFourSame", bestTime(fourSame, 200, repeats)/len(boards))
+
+		# clearPile is timed with the undo that puts the pile back.
+		fullBoards = [board for board in boards if not board.peekPile() == None]
+		def clear():
+			for board in fullBoards:
+				board.undo(board.apply(("CLEAR",)))
+		if not fullBoards == []:
+			addTime(results, name + ".clearPile+undo", bestTime(clear, 20, repeats)/len(fullBoards))
+
+	# The pop/push topFourSame against the run-tracking PileStack, on a pile trace.
+	trace = pileTrace(20000, seed)
+	addTime(results, "pile.topFourSame.legacy", timeTrace(trace, util.Stack, legacyTopFourSame, repeats)/len(trace))
+	addTime(results, "pile.topFourSame.tracked", timeTrace(trace, util.PileStack, trackedTopFourSame, repeats)/len(trace))
+
+# Hand and pile seen by an agent at one decision, with a hand view over them.
+class Decision:
+
+	def __init__(self, board, player):
+		self.hand = board.viewHand(player)
+		self.upCards = board.viewUpCards(player)
+		self.playableCards = board.getPlayableHandCards(player)
+		self.pileCard = board.peekPile()
+		self.handView = gb.HandView(self, util.RankIndex(self.hand))
+
+	# Lets the hand view read the pile.
+	def peekPile(self):
+		return self.pileCard
+
+# Returns an agent of agentType for timing decisions.
+def makeAgent(agentType, rng):
+	if agentType == "RANDOM":
+		return agents.RandomAgent(1, rng)
+	if agentType == "GREEDY":
+		return agents.GreedyAgent(1)
+	if agentType == "HEURISTIC":
+		return agents.HeuristicAgent(1)
+	weights = {"hand-size": 0.0, "opp-hand-size": 0.0, "pile-size": 0.0, "discard-size": 0.0, "deck-size": 0.0, "num-playable-on": 0.0}
+	agent = agents.QLearningAgent(1, weights, rng)
+	agent.inPreGame = False
+	return agent
+
+# Times each agent's chooseHandCard on hands taken from mid-game boards.
+# Each decision has its own hand view, as in a game.
+def benchmarkAgents(results, numBoards, repeats, seed):
+	decisions = []
+	for board in sampleBoards(gb.GameBoard, numBoards, seed):
+		for player in board.players:
+			if not board.viewHand(player) == []:
+				decisions.append(Decision(board, player))
+
+	for agentType in AGENT_TYPES:
+		agent = makeAgent(agentType, random.Random(seed))
+		def decide():
+			for decision in decisions:
+				agent.setHandView(decision.handView)
+				agent.chooseHandCard(decision.hand, decision.upCards, decision.playableCards)
+		name = "agent." + agentType + ".chooseHandCard"
+		try:
+			addTime(results, name, quietly(lambda: bestTime(decide, 5, repeats))/len(decisions))
+		except Exception as error:
+			addError(results, name, error)
+
+# Plays numGames seeded headless games for every ordered pairing of agents on
+# each engine and records games per second, from the best of repeats runs.
+# The games are seeded, so every run plays the same ones.
+def benchmarkGames(results, numGames, repeats, seed):
+	for boardType in BOARD_TYPES:
+		for p1 in AGENT_TYPES:
+			for p2 in AGENT_TYPES:
+				name = "games." + boardType.__name__ + "." + p1 + "-" + p2
+				def run():
+					for i in range(1, numGames + 1):
+						ex.playTrial((i, seed, p1, p2, boardType, None))
+				try:
+					addRate(results, name, numGames/quietly(lambda: bestTime(run, 1, repeats)), "games/s")
+				except Exception as error:
+					addError(results, name, error)
+
+# Runs the whole suite and returns its results with the run's metadata.
+def runSuite(quick=False, seed=0):
+	if quick:
+		numBoards, repeats, numGames = 30, 3, 10
+	else:
+		numBoards, repeats, numGames = 200, 5, 50
+	results = {}
+	benchmarkCards(results, repeats)
+	benchmarkStack(results, repeats)
+	benchmarkBoards(results, numBoards, repeats, seed)
+	benchmarkAgents(results, numBoards, repeats, seed)
+	benchmarkGames(results, numGames, repeats, seed)
+	meta = {"python": platform.python_version(), "platform": platform.platform(),
+		"time": time.strftime("%Y-%m-%d %H:%M:%S"), "quick": quick, "seed": seed}
+	return {"meta": meta, "results": results}
+
+# Prints the results of a suite run.
+def printResults(suite):
+	for name in sorted(suite["results"]):
+		result = suite["results"][name]
+		if result["value"] == None:
+			print name.ljust(48) + "ERROR " + result["error"]
+		else:
+			print name.ljust(48) + str(round(result["value"], 2)).rjust(12) + " " + result["unit"]
+
+# Compares a suite run against a baseline run. Prints each shared benchmark's
+# change and returns the names of those that got worse by more than
+# tolerance (a fraction; at least GAME_TOLERANCE for the games.* entries),
+# or that failed in the run but not the baseline.
+def compare(suite, baseline, tolerance=TOLERANCE):
+	regressions = []
+	print "\n"
+	print "##############################"
+	print "COMPARISON WITH BASELINE (" + baseline["meta"]["time"] + "):"
+	print "##############################"
+	for name in sorted(suite["results"]):
+		if not name in baseline["results"]:
+			print name.ljust(48) + "new"
+			continue
+		old = baseline["results"][name]["value"]
+		new = suite["results"][name]["value"]
+		if new == None:
+			if not old == None:
+				regressions.append(name)
+				print name.ljust(48) + "FAILED"
+			continue
+		if old == None or old == 0:
+			print name.ljust(48) + "fixed"
+			continue
+		# Positive speedup is better, whichever way the unit runs.
+		if suite["results"][name]["higherIsBetter"]:
+			speedup = new/old - 1
+		else:
+			speedup = old/new - 1
+		flag = ""
+		limit = tolerance
+		if name.startswith("games."):
+			limit = max(tolerance, GAME_TOLERANCE)
+		if speedup < -limit:
+			flag = "  REGRESSION"
+			regressions.append(name)
+		print name.ljust(48) + ("%+.1f%%" % (100*speedup)).rjust(10) + flag
+	return regressions
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Scheisskopf benchmark suite.")
+	parser.add_argument("--quick", action="store_true", help="fewer boards, repeats and games")
+	parser.add_argument("--output", help="write the results to this JSON file")
+	parser.add_argument("--baseline", help="compare against the results in this JSON file")
+	parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="slowdown counted as a regression (default 0.10; at least 0.25 for whole games)")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--pile", action="store_true", help="only run the topFourSame comparison")
+	args = parser.parse_args()
+
+	if args.pile:
+		benchmarkTopFourSame()
+		sys.exit(0)
+
+	suite = runSuite(args.quick, args.seed)
+	printResults(suite)
+	if not args.output == None:
+		f = open(args.output, "w")
+		try:
+			json.dump(suite, f, indent=1, sort_keys=True)
+		finally:
+			f.close()
+	if not args.baseline == None:
+		f = open(args.baseline)
+		try:
+			baseline = json.load(f)
+		finally:
+			f.close()
+		regressions = compare(suite, baseline, args.tolerance)
+		if not regressions == []:
+			print str(len(regressions)) + " regression(s): " + ", ".join(regressions)
+			sys.exit(1)
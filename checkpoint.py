@@ -0,0 +1,164 @@
+import featureExtractor as fe
+import numpy as np
+import numpy.lib.format
+import json
+import os
+import struct
+import threading
+import zipfile
+
+#######################################################
+#######################################################
+# checkpoint.py
+#
+# Saves and loads a Q-learner's weights. A checkpoint is
+# an uncompressed .npz file holding:
+#   version   the checkpoint format version,
+#   features  the feature names, in weight order,
+#   weights   the weight vector (float64),
+#   metadata  JSON: episodes trained, opponents,
+#             hyperparameters and so on.
+# Weights are looked up by feature name on loading, so a
+# checkpoint outlives a reordering of the features. As the
+# file is not compressed, the weight vector can also be
+# memory mapped, so any number of evaluation processes
+# share one copy of it.
+#######################################################
+#######################################################
+
+VERSION = 1
+
+# Writes weights (a dict from features to weights) and metadata (a dict
+# that JSON can encode) to path. The file is written beside path and moved
+# into place, so a reader never sees half a checkpoint.
+def saveCheckpoint(path, weights, metadata=None):
+	if metadata == None:
+		metadata = {}
+	features = sorted(weights.keys(), key=featureOrder)
+	tempPath = path + ".tmp"
+	f = open(tempPath, "wb")
+	try:
+		np.savez(f, version=np.array(VERSION), features=np.array(features), weights=np.array([weights[feature] for feature in features], dtype=np.float64), metadata=np.array(json.dumps(metadata, sort_keys=True)))
+	finally:
+		f.close()
+	os.rename(tempPath, path)
+
+# Sorts the features of fe.FEATURES first, in their order, and any others after.
+def featureOrder(feature):
+	if feature in fe.FEATURES:
+		return (0, fe.FEATURES.index(feature))
+	return (1, feature)
+
+# Returns (weights, metadata) from a checkpoint: the weights as a dict from
+# features to weights. Raises ValueError for an unknown format version.
+def loadCheckpoint(path):
+	data = np.load(path)
+	try:
+		checkVersion(path, int(data["version"]))
+		features = [str(feature) for feature in data["features"]]
+		weights = dict(zip(features, data["weights"].tolist()))
+		metadata = json.loads(str(data["metadata"]))
+	finally:
+		data.close()
+	return (weights, metadata)
+
+# Returns the metadata of a checkpoint.
+def loadMetadata(path):
+	return loadCheckpoint(path)[1]
+
+# Raises ValueError if version is not a checkpoint version this module reads.
+def checkVersion(path, version):
+	if not version == VERSION:
+		raise ValueError(path + " is checkpoint version " + str(version) + ", expected " + str(VERSION))
+
+# Returns the weight vector of a checkpoint as a read-only NumPy memory map
+# in fe.FEATURES order, for QLearningAgent.useWeightVector. Processes that
+# map the same file share its pages. Raises ValueError if the checkpoint's
+# features are not fe.FEATURES in order; use loadCheckpoint for those.
+def mapWeights(path):
+	data = np.load(path)
+	try:
+		checkVersion(path, int(data["version"]))
+		features = [str(feature) for feature in data["features"]]
+	finally:
+		data.close()
+	if not features == fe.FEATURES:
+		raise ValueError(path + " has features " + ", ".join(features) + ", not the current ones")
+
+	# Find the weights member's .npy data inside the zip file.
+	archive = zipfile.ZipFile(path)
+	try:
+		info = archive.getinfo("weights.npy")
+	finally:
+		archive.close()
+	if not info.compress_type == zipfile.ZIP_STORED:
+		raise ValueError(path + " is compressed and cannot be mapped")
+	f = open(path, "rb")
+	try:
+		f.seek(info.header_offset)
+		localHeader = f.read(30)
+		nameLength, extraLength = struct.unpack("<HH", localHeader[26:30])
+		f.seek(info.header_offset + 30 + nameLength + extraLength)
+		version = np.lib.format.read_magic(f)
+		if version == (1, 0):
+			shape, fortranOrder, dtype = np.lib.format.read_array_header_1_0(f)
+		else:
+			shape, fortranOrder, dtype = np.lib.format.read_array_header_2_0(f)
+		offset = f.tell()
+	finally:
+		f.close()
+	return np.memmap(path, dtype, "r", offset, shape)
+
+# Saves checkpoints on a background thread, so saving never holds up the
+# caller. If a checkpoint is requested while another is being written, only
+# the newest waiting request is kept. Call close to write the last one.
+class CheckpointWriter:
+
+	def __init__(self):
+		self.condition = threading.Condition()
+		self.pending = None		# (path, weights, metadata) waiting to be written.
+		self.closed = False
+		self.error = None
+		self.thread = threading.Thread(target=self.writeLoop)
+		self.thread.daemon = True
+		self.thread.start()
+
+	# Asks for weights and metadata to be saved to path. weights is copied.
+	def save(self, path, weights, metadata=None):
+		self.condition.acquire()
+		try:
+			self.pending = (path, dict(weights), metadata)
+			self.condition.notify()
+		finally:
+			self.condition.release()
+
+	# Writes pending checkpoints until closed.
+	def writeLoop(self):
+		while True:
+			self.condition.acquire()
+			try:
+				while self.pending == None and not self.closed:
+					self.condition.wait()
+				if self.pending == None:
+					return
+				path, weights, metadata = self.pending
+				self.pending = None
+			finally:
+				self.condition.release()
+			try:
+				saveCheckpoint(path, weights, metadata)
+			except Exception as error:
+				self.error = error
+
+	# Writes any waiting checkpoint and stops the thread. Raises the error
+	# of a failed save, if any.
+	def close(self):
+		self.condition.acquire()
+		try:
+			self.closed = True
+			self.condition.notify()
+		finally:
+			self.condition.release()
+		self.thread.join()
+		if not self.error == None:
+			raise self.error
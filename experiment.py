@@ -1,89 +1,451 @@
 import game as g
+import GameBoard as gb
+import util
+import stats
+import resultSink
+import profiler as prof
+import random
+import math
+import time
+import multiprocessing
+
+THRESHOLD = 5000	# Maximum number of turns allowed per game: exceeding implies a draw.
+STOPPING_CHUNK_SIZE = 16	# Largest default chunk for parallel runs with a stopping rule.
+
+# Advances game until it ends or passes threshold turns. Returns the number of turns taken.
+def playGame(game, threshold, printTrials=False):
+	turns = 0
+	if printTrials:
+		game.printState()
+
+	# If the game is not over, advance game by one turn.
+	while not game.isEnded():
+		if turns > threshold:
+			break
+		game.takeTurn()
+		turns += 1
+		if printTrials:
+			game.printState()
+	return turns
+
+# Returns the record of a finished game:
+# (winner, turns, seed, trialIndex, pickups, clears, duration, events).
+# seed is the game's random seed (0 if it had none), duration is in seconds
+# and events, at index 7, is the game's event counters (see game.getEvents).
+def gameRecord(game, turns, seed, trialIndex, duration):
+	return (game.getWinner(), turns, seed, trialIndex, game.getNumPickups(), game.getNumClears(), duration, game.getEvents())
+
+# Plays one headless game of an experiment and returns its record (see gameRecord).
+# args is (trialIndex, masterSeed, playerOneType, playerTwoType, boardType, repetitionLimit).
+# Defined at module level so worker processes can run it.
+def playTrial(args):
+	trialIndex, masterSeed, playerOneType, playerTwoType, boardType, repetitionLimit = args
+	start = time.time()
+	rng = util.gameRandom(masterSeed, trialIndex)
+	game = g.Game(playerOneType, playerTwoType, None, boardType, repetitionLimit, rng)
+	turns = playGame(game, THRESHOLD)
+	return gameRecord(game, turns, util.trialSeed(masterSeed, trialIndex), trialIndex, time.time() - start)
+
+# Plays the headless games firstIndex to lastIndex of an experiment and
+# returns their stats.GameStats, so a worker sends back one summary per block
+# instead of a record per game. args is (firstIndex, lastIndex, masterSeed,
+# playerOneType, playerTwoType, boardType, repetitionLimit).
+def playTrialBlock(args):
+	firstIndex, lastIndex, masterSeed, playerOneType, playerTwoType, boardType, repetitionLimit = args
+	gameStats = stats.GameStats(THRESHOLD + 1)
+	for i in xrange(firstIndex, lastIndex + 1):
+		record = playTrial((i, masterSeed, playerOneType, playerTwoType, boardType, repetitionLimit))
+		gameStats.addGame(record[0], record[1], record[7])
+	return gameStats
+
+# Maps a seat number to the other seat (None, a draw, stays None).
+def otherSeat(seat):
+	if seat == None:
+		return None
+	return 3 - seat
+
+# Plays one pair of a duplicate experiment: a single shuffled deck is played
+# twice, once with agent A in seat 1 and once with agent B in seat 1. The
+# same seat goes first both times, so the starting agent is swapped too.
+# Returns the two game records; in the second, player 1 is agent B.
+# args is (pairIndex, masterSeed, typeA, typeB, boardType, repetitionLimit).
+def playDuplicatePair(args):
+	pairIndex, masterSeed, typeA, typeB, boardType, repetitionLimit = args
+	dealRng = util.gameRandom(masterSeed, pairIndex)
+	deckOrder = list(util.CARDS)
+	dealRng.shuffle(deckOrder)
+	firstSeat = dealRng.choice([1, 2])
+
+	# The agents get their own streams, so the deal is the only thing shared.
+	pairSeed = util.trialSeed(masterSeed, pairIndex)
+	records = []
+	for seat, playerOneType, playerTwoType in [(1, typeA, typeB), (2, typeB, typeA)]:
+		start = time.time()
+		game = g.Game(playerOneType, playerTwoType, None, boardType, repetitionLimit, util.gameRandom(pairSeed, seat), deckOrder, firstSeat)
+		turns = playGame(game, THRESHOLD)
+		records.append(gameRecord(game, turns, util.trialSeed(pairSeed, seat), pairIndex, time.time() - start))
+	return tuple(records)
+
+# Returns a copy of record with the winner's seat swapped, so that player 1
+# means the agent that sat in seat 2.
+def swapSeats(record):
+	return (otherSeat(record[0]),) + record[1:]
+
+# Returns agent A's score for a game record where player 1 is agent A:
+# 1 for a win, 0 for a loss and 0.5 for a draw.
+def scoreA(record):
+	winner = record[0]
+	if winner == None:
+		return 0.5
+	if winner == 1:
+		return 1.0
+	return 0.0
 
 # Used to run multiple games at a time and assess agent performance.
 class Experiment:
 
-	def __init__(self, trials, playerOneType, playerTwoType, printTrials, graphics):
+	# If repetitionLimit is given, games that repeat a position that many
+	# times are called drawn instead of running to the turn threshold.
+	# If graphics is None, games run headless and need no display.
+	# If seed is given, every game gets its own random stream seeded from
+	# (seed, trial number), so runs are reproducible and any single game can be
+	# replayed from its trial number with replayTrial. workers > 1 shards the trials across that many processes
+	# in chunks of chunkSize; a parallel run gives the same results as a serial
+	# run with the same seed.
+	# If duplicate is set, the trials are played as trials/2 pairs: each deal
+	# is played twice with the seats and starting player swapped, and the
+	# summary adds the paired difference in win rate with its standard error.
+	# Duplicate experiments run headless and need an even number of trials.
+	# If stoppingRule is given (see sequential.py), the experiment stops as
+	# soon as the rule is satisfied and trials is only a cap. In a duplicate
+	# experiment the rule is fed agent A as player 1 and checked after each pair.
+	# If resultPath is given, a record of every game is appended to that file
+	# as it finishes (see resultSink.py).
+	# If profile is set, the phases of every turn are timed (see profiler.py)
+	# and reported after the summary; profilePath also writes them as JSON.
+	# Profiling needs the games in this process, so it is for serial runs.
+	def __init__(self, trials, playerOneType, playerTwoType, printTrials, graphics, boardType=gb.GameBoard, repetitionLimit=None, seed=None, workers=1, chunkSize=None, duplicate=False, stoppingRule=None, resultPath=None, profile=False, profilePath=None):
+		if duplicate and (trials < 2 or trials%2 == 1):
+			raise ValueError("A duplicate experiment plays whole pairs and needs an even number of trials, not " + str(trials))
 		self.trials = trials
 		self.playerOneType = playerOneType
 		self.playerTwoType = playerTwoType
 		self.printTrials = printTrials
 		self.graphics = graphics
+		self.boardType = boardType	# Board engine: GameBoard.GameBoard or BitBoard.BitBoard.
+		self.repetitionLimit = repetitionLimit
+		self.seed = seed
+		self.workers = workers
+		self.chunkSize = chunkSize
+		self.duplicate = duplicate
+		self.stoppingRule = stoppingRule
+		self.resultPath = resultPath
+		self.sink = None
+		self.profile = profile or not profilePath == None
+		self.profilePath = profilePath
+		self.profiler = None
 
 	# Runs the experiment.
 	def run(self):
-		wins = [0, 0, 0]	# To store the number of draws, player 1 wins, and player 2 wins.
-		numTurns = []		# To store the number of turns taken for each game.
-		threshold = 5000	# Maximum number of turns allowed per game: exceeding implies a draw.
+		threshold = THRESHOLD
 
 		print "\n"
 		print "##############################"
 		print "RUNNING EXPERIMENT: " + self.playerOneType + " vs. " + self.playerTwoType
-		print "Number of trials: " + str(self.trials)
+		if self.stoppingRule == None:
+			print "Number of trials: " + str(self.trials)
+		else:
+			print "Maximum number of trials: " + str(self.trials)
 		print "Draw threshold: " + str(threshold)
+		if self.workers > 1:
+			print "Workers: " + str(self.workers)
+		if self.duplicate:
+			print "Duplicate deals: " + str(self.trials/2) + " pairs"
 		print "##############################"
 		print "\n"
 
-		# Run <self.trials> games, each time recording who won and number of turns. 
-		for i in range(1, self.trials+1):
-			turns = 0
-			game = g.Game(self.playerOneType, self.playerTwoType, self.graphics)
+		# Turn counts are capped at THRESHOLD + 1, so the turn histogram is exact.
+		self.gameStats = stats.GameStats(THRESHOLD + 1)
+		self.pairStats = stats.PairedStats()
+		if not self.resultPath == None:
+			self.sink = resultSink.ResultSink(self.resultPath)
+		self.profiler = None
+		if self.profile:
+			if self.duplicate or self.workers > 1:
+				print "Profiling is only available in serial runs; ignored."
+			else:
+				self.profiler = prof.TurnProfiler()
+		try:
+			if self.duplicate:
+				self.runDuplicate()
+			elif self.workers > 1:
+				self.runParallel()
+			else:
+				self.runSerial()
+		finally:
+			if not self.sink == None:
+				self.sink.close()
+				self.sink = None
+		self.printSummary(self.gameStats)
+		if self.duplicate:
+			self.printPairedSummary(self.pairStats)
+		if not self.stoppingRule == None:
+			self.printStoppingSummary(self.gameStats.getCount())
+		if not self.profiler == None:
+			self.profiler.printReport()
+			if not self.profilePath == None:
+				self.profiler.write(self.profilePath)
+
+	# Returns the stats.GameStats of the last run.
+	def getGameStats(self):
+		return self.gameStats
+
+	# Returns the profiler.TurnProfiler of the last run, or None.
+	def getProfiler(self):
+		return self.profiler
+
+	# Returns the stats.PairedStats of the last run (empty unless duplicate).
+	def getPairedStats(self):
+		return self.pairStats
+
+	# Runs <self.trials> games in this process, each time recording who won and number of turns.
+	def runSerial(self):
+		for i in xrange(1, self.trials+1):
+			start = time.time()
+			rng = None
+			seed = 0
+			if not self.seed == None:
+				rng = util.gameRandom(self.seed, i)
+				seed = util.trialSeed(self.seed, i)
+			game = g.Game(self.playerOneType, self.playerTwoType, self.graphics, self.boardType, self.repetitionLimit, rng)
+			if not self.profiler == None:
+				game.setProfiler(self.profiler)
 			gameBoard = game.getGameBoard()
-			self.graphics.setGameBoard(gameBoard)
-			self.graphics.updateGraphics()
+			if not self.graphics == None:
+				self.graphics.setGameBoard(gameBoard)
+				self.graphics.updateGraphics()
+
+			turns = playGame(game, THRESHOLD, self.printTrials)
+			if self.addRecord(gameRecord(game, turns, seed, i, time.time() - start)):
+				break
+
+	# Runs <self.trials> headless games across a pool of worker processes.
+	# Without a stopping rule or result file, workers play blocks of chunkSize
+	# games and return merged stats; otherwise records come back one game at a
+	# time in trial order, so the rule and the file see them in the same order
+	# as in a serial run.
+	def runParallel(self):
+		self.prepareHeadless("Parallel")
+		if self.stoppingRule == None and self.sink == None:
+			blockSize = self.getChunkSize(self.trials)
+			blockArgs = ((i, min(i + blockSize - 1, self.trials), self.seed, self.playerOneType, self.playerTwoType, self.boardType, self.repetitionLimit) for i in xrange(1, self.trials+1, blockSize))
+			self.mapTrials(playTrialBlock, blockArgs, self.addBlock, 1)
+		else:
+			trialArgs = ((i, self.seed, self.playerOneType, self.playerTwoType, self.boardType, self.repetitionLimit) for i in xrange(1, self.trials+1))
+			self.mapTrials(playTrial, trialArgs, self.addRecord, self.getChunkSize(self.trials))
+
+	# Runs <self.trials>/2 duplicate pairs, in this process or across the
+	# worker pool, in pair order.
+	def runDuplicate(self):
+		self.prepareHeadless("Duplicate")
+		numPairs = self.trials/2
+		pairArgs = ((i, self.seed, self.playerOneType, self.playerTwoType, self.boardType, self.repetitionLimit) for i in xrange(1, numPairs+1))
+		self.mapTrials(playDuplicatePair, pairArgs, self.addPair, self.getChunkSize(numPairs))
+
+	# Returns the chunk size for spreading numJobs jobs over the workers.
+	def getChunkSize(self, numJobs):
+		if not self.chunkSize == None:
+			return self.chunkSize
+		chunkSize = max(1, numJobs/(self.workers*4))
+		if not self.stoppingRule == None:
+			# Small chunks, so little work is thrown away on an early stop.
+			chunkSize = min(chunkSize, STOPPING_CHUNK_SIZE)
+		return chunkSize
 
-			if self.printTrials:
-				game.printState()
+	# Picks a seed if there is none and warns that graphics are ignored.
+	def prepareHeadless(self, mode):
+		if self.seed == None:
+			self.seed = random.getrandbits(32)
+			print "Seed: " + str(self.seed)
+		if not self.graphics == None or self.printTrials:
+			print mode + " experiments run headless; graphics and printTrials are ignored."
 
-			# If the game is not over, advance game by one turn.
-			while not game.isEnded():
-				if turns > threshold:
+	# Maps function over the args iterable, in this process if there is one
+	# worker and across a pool of worker processes otherwise, and passes each
+	# result to consume in argument order. Stops early once consume returns
+	# True, so the same results are consumed whatever the number of workers.
+	def mapTrials(self, function, args, consume, chunkSize):
+		if self.workers <= 1:
+			for jobArgs in args:
+				if consume(function(jobArgs)):
 					break
-				game.takeTurn()
-				turns += 1
-				if self.printTrials:
-					game.printState()
-
-			# Record the winner and number of turns.
-			winner = game.getWinner()
-			if winner == None:
-				wins[0] += 1
+			return
+
+		pool = multiprocessing.Pool(self.workers)
+		try:
+			stopped = False
+			for result in pool.imap(function, args, chunkSize):
+				if consume(result):
+					stopped = True
+					break
+			if stopped:
+				pool.terminate()
 			else:
-				wins[winner] += 1
-			numTurns.append(turns)
+				pool.close()
+		except:
+			pool.terminate()
+			raise
+		finally:
+			pool.join()
+
+	# Plays the trialIndex'th game of a seeded experiment again, on its own,
+	# and returns the finished Game. Pass graphics to watch it. The
+	# experiment must have a seed: unseeded games cannot be played again. Not
+	# for duplicate experiments, whose games are played by playDuplicatePair.
+	def replayTrial(self, trialIndex, graphics=None, printTrials=False):
+		if self.seed is None:
+			raise ValueError("Only trials of a seeded experiment can be replayed")
+		rng = util.gameRandom(self.seed, trialIndex)
+		game = g.Game(self.playerOneType, self.playerTwoType, graphics, self.boardType, self.repetitionLimit, rng)
+		playGame(game, THRESHOLD, printTrials)
+		return game
+
+	# Adds a list of game records to the stats and reports progress.
+	# Returns True if the stopping rule is now satisfied.
+	def addRecords(self, records):
+		for record in records:
+			self.gameStats.addGame(record[0], record[1], record[7])
+			self.printProgress(self.gameStats.getCount())
+		return self.isStopped(records)
+
+	# Adds one game record with playerOneType as player 1.
+	def addRecord(self, record):
+		self.writeRecord(record, self.playerOneType, self.playerTwoType)
+		return self.addRecords([record])
+
+	# Adds one pair of records from playDuplicatePair. The stats count the
+	# second game with agent A as player 1.
+	def addPair(self, pair):
+		first, second = pair
+		self.writeRecord(first, self.playerOneType, self.playerTwoType)
+		self.writeRecord(second, self.playerTwoType, self.playerOneType)
+		second = swapSeats(second)
+		self.pairStats.addPair(scoreA(first), scoreA(second))
+		return self.addRecords([first, second])
 
-			# Print out experiment progress.
-			if self.trials > i:
-				tenth = self.trials/10
-				if i%tenth == 0:
-					print "Experiment progress: " + str((i/(tenth))*10) + "%"
+	# Writes a game record to the result file, if there is one.
+	def writeRecord(self, record, playerOneType, playerTwoType):
+		if self.sink == None:
+			return
+		winner, turns, seed, trialIndex, pickups, clears, duration = record[:7]
+		self.sink.write(seed, trialIndex, playerOneType, playerTwoType, winner, turns, pickups, clears, duration)
 
+	# Merges the stats.GameStats of a block of games from playTrialBlock.
+	def addBlock(self, blockStats):
+		before = self.gameStats.getCount()
+		self.gameStats.merge(blockStats)
+		for i in xrange(before + 1, self.gameStats.getCount() + 1):
+			self.printProgress(i)
+		return False
+
+	# Feeds a list of game records to the stopping rule. Returns True if
+	# the rule is now satisfied, and False if there is no rule.
+	def isStopped(self, records):
+		if self.stoppingRule == None:
+			return False
+		for record in records:
+			self.stoppingRule.addResult(record[0])
+		return self.stoppingRule.isDone()
+
+	# Print out experiment progress after i games.
+	def printProgress(self, i):
+		tenth = self.trials/10
+		if self.trials > i and tenth > 0 and i%tenth == 0:
+			print "Experiment progress: " + str((i/(tenth))*10) + "%"
+
+	# Prints the summary statistics of a stats.GameStats.
+	def printSummary(self, gameStats):
+		numGames = gameStats.getCount()
+		turns = gameStats.getTurns()
+		histogram = gameStats.getHistogram()
 
 		print "\n"
 		print "##############################"
 		print "SUMMARY STATISTICS:"
 		print "##############################"
-		print "Draw rate: " + str(wins[0]/float(self.trials))
+		print "Games played: " + str(numGames)
+		print "Draw rate: " + str(gameStats.getOutcomeCount(None)/float(numGames))
 
-		player1WinRate =  wins[1]/float(self.trials)
-		player2WinRate = wins[2]/float(self.trials)
+		player1WinRate = gameStats.getOutcomeCount(1)/float(numGames)
+		player2WinRate = gameStats.getOutcomeCount(2)/float(numGames)
 		print "Player 1 (" + self.playerOneType + ") win rate: " + str(player1WinRate)
 		print "Player 2 (" + self.playerTwoType + ") win rate: " + str(player2WinRate)
 		print "\n"
 
-		print "Least number of turns: " + str(min(numTurns))
-		print "Greatest number of turns: " + str(max(numTurns))
-		print "Average number of turns: " + str(sum(numTurns)/len(numTurns))
+		print "Least number of turns: " + str(turns.getMin())
+		print "Greatest number of turns: " + str(turns.getMax())
+		print "Average number of turns: " + str(round(turns.getMean(), 2))
+		print "Standard deviation of turns: " + str(round(math.sqrt(turns.getVariance()), 2))
+		print "Median number of turns: " + str(histogram.getMedian())
+		print "90th / 99th percentile of turns: " + str(histogram.getPercentile(90)) + " / " + str(histogram.getPercentile(99))
+		print "\n"
+
+		outcomeNames = ["Draws", "Player 1 wins", "Player 2 wins"]
+		for outcome in range(0, 3):
+			outcomeTurns = gameStats.getOutcomeTurns(outcome)
+			if outcomeTurns.getCount() == 0:
+				continue
+			print outcomeNames[outcome] + ": " + str(outcomeTurns.getCount()) + " games, " + str(round(outcomeTurns.getMean(), 2)) + " turns on average (" + str(outcomeTurns.getMin()) + " to " + str(outcomeTurns.getMax()) + ")"
 
-		# Compute median number of turns.
-		numTurns.sort()
-		if self.trials%2 == 0:
-			index = int((float(self.trials)/2) - 1)
-			median = (numTurns[index] + numTurns[index+1])/float(2)
+		events = gameStats.getEvents()
+		if not events == None:
+			print "\n"
+			print "Game events".ljust(18) + "total".rjust(10) + "per game".rjust(10) + "max".rjust(8)
+			for i in range(0, g.NUM_EVENTS):
+				print g.EVENT_NAMES[i].ljust(18) + str(events.getTotal(i)).rjust(10) + str(round(events.getMean(i), 2)).rjust(10) + str(events.getMax(i)).rjust(8)
+
+	# Prints how many games the stopping rule needed and its decision.
+	def printStoppingSummary(self, numGames):
+		print "\n"
+		print "##############################"
+		print "SEQUENTIAL STOPPING:"
+		print "##############################"
+		if self.stoppingRule.isDone():
+			print "Stopped after " + str(numGames) + " of at most " + str(self.trials) + " games."
 		else:
-			index = int((float(self.trials)/2))
-			median = numTurns[index]
-		print "Median number of turns: " + str(median)
+			print "Reached the cap of " + str(numGames) + " games without stopping."
+		for line in self.stoppingRule.describe():
+			print line
+
+	# Prints the paired comparison of a duplicate experiment. Each pair's
+	# difference is agent A's mean score over its two games minus agent B's,
+	# so its mean estimates the difference in win rate. The variance
+	# reduction compares against the same number of independent games.
+	def printPairedSummary(self, pairStats):
+		diffs = pairStats.getPairDiffs()
+		numPairs = diffs.getCount()
+		mean = diffs.getMean()
+
+		print "\n"
+		print "##############################"
+		print "PAIRED (DUPLICATE) STATISTICS:"
+		print "##############################"
+		print "Pairs played: " + str(numPairs)
+		print "Win rate difference (" + self.playerOneType + " - " + self.playerTwoType + "): " + str(mean)
+		if numPairs < 2:
+			print "At least 2 pairs are needed for a variance estimate."
+			return
+
+		variance = diffs.getVariance()
+		stdError = diffs.getStdError()
+		print "Variance of paired difference: " + str(variance)
+		print "Standard error: " + str(stdError)
+		print "95% confidence interval: [" + str(mean - 1.96*stdError) + ", " + str(mean + 1.96*stdError) + "]"
+
+		# Games scored one at a time, as an unpaired experiment would see them.
+		gameVariance = pairStats.getGameDiffs().getVariance()
+		if variance > 0:
+			print "Variance reduction vs. independent deals: " + str(round((gameVariance/2)/variance, 2)) + "x"
 
 	def getGameBoard(self):
 		return self.gameBoard
@@ -1,5 +1,42 @@
 import util
 
+# Names of the features, in the order of the columns of a feature matrix
+# and of a Q-learner's weight vector.
+FEATURES = ["hand-size", "opp-hand-size", "pile-size", "discard-size", "deck-size", "num-playable-on"]
+NUM_FEATURES = len(FEATURES)
+NUM_STATE_FEATURES = NUM_FEATURES - 1	# Leading features that do not depend on the action.
+
+# The part of a state's features that does not depend on the action,
+# computed once per decision: the state features and a rank histogram of
+# the hand, from which the action feature of every candidate play follows
+# without copying the hand.
+class StateBlock:
+
+	def __init__(self, features, hand):
+		self.features = features
+		self.handSize = len(hand)
+		self.rankCounts = [0]*15	# Number of hand cards of each rank.
+		for card in hand:
+			self.rankCounts[card.rank] += 1
+		self.playableOn = dict()	# Rank to the number of hand cards playable on it, as needed.
+
+	# Returns the number of cards left in hand that are playable on the pile
+	# after count cards of rank are played from it.
+	def countPlayableOn(self, rank, count):
+		if self.handSize == 0:
+			return 0
+		playable = util.RANK_PLAYABLE[rank]
+		numPlayable = self.playableOn.get(rank)
+		if numPlayable == None:
+			numPlayable = 0
+			for otherRank in range(2, 15):
+				if playable[otherRank]:
+					numPlayable += self.rankCounts[otherRank]
+			self.playableOn[rank] = numPlayable
+		if playable[rank]:
+			numPlayable -= count
+		return numPlayable
+
 # Extracts a feature vector from a Q-learner's state representation.
 class featureExtractor:
 
@@ -8,77 +45,46 @@ class featureExtractor:
 
 	# Returns a dict from features to counts.
 	def getFeatures(self, state, action):
+		block = self.getStateBlock(state)
+		return dict(zip(FEATURES, block.features + [self.getActionFeature(block, action)]))
+
+	# Returns the features of each of actions in state as lists in FEATURES order.
+	def getFeatureRows(self, state, actions):
+		block = self.getStateBlock(state)
+		return [block.features + [self.getActionFeature(block, action)] for action in actions]
+
+	# Writes the features of each of actions into a row of matrix, which must
+	# have at least len(actions) rows and NUM_FEATURES columns (e.g. a NumPy
+	# array). Returns the filled rows.
+	def fillFeatureMatrix(self, state, actions, matrix):
+		numActions = len(actions)
+		rows = matrix[:numActions]
+		block = self.getStateBlock(state)
+		rows[:, :NUM_STATE_FEATURES] = block.features
+		rows[:, NUM_STATE_FEATURES] = [self.getActionFeature(block, action) for action in actions]
+		return rows
+
+	# Returns the StateBlock of state.
+	def getStateBlock(self, state):
 		hand = state.getHand()
-		handSize = len(hand)
-		upCards = state.getUpCards()
-		oppHandRep = state.getOppHandRep()
-		oppHandSize = len(oppHandRep)
-		pileRep = state.getPileRep()
-		pileSize = pileRep.size()
-		discardRep = state.getDiscardRep()
-		discardSize = len(discardRep)
-		deckSize = state.getDeckSize()
-		numCardsInAction = len(action)
-
-		# Compute the number of hand cards playable on the newly played card(s).
-
-		if action == "DOWNCARD":
-			numPlayableOn = 0
-
-		elif hand == []:
-			numPlayableOn = 0
-
-		elif isinstance(action, tuple):
-			if action[0] == None:
-				newHand = list(hand)
-
-			for card in action[1]:
-				newHand.remove(card)
-
-			newPileCard = action[1][0]
-			if newPileCard == 10 or newPileCard == 3:
-				numPlayableOn = len(newHand)
-			else:
-				numPlayableOn = 0
-				for card in newHand:
-					if card.isPlayableOn(newPileCard):
-						numPlayableOn += 1
-
-					else:
-						numPlayableOn = len(hand)
-		elif action == []:
-			numPlayableOn = 0
-		else:
-			newPileCard = action[0]
-			newHand = list(hand)
-			for card in action:
-				newHand.remove(card)
-
-			numPlayableOn = 0
-			for card in newHand:
-				if card.isPlayableOn(newPileCard):
-					numPlayableOn += 1
-			
-		# FEATURES:
-		output = dict()
-		# Size of hand.
-		output["hand-size"] = handSize
-
-		# Size of opponent's hand.
-		output["opp-hand-size"] = oppHandSize
-
-		# Size of pile.
-		output["pile-size"] = pileSize
-
-		# Size of discard pile.
-		output["discard-size"] = discardSize
-
-		# Size of deck.
-		output["deck-size"] = deckSize
-
-		# Number of cards in hand playable on pile after action.
-		output["num-playable-on"] = numPlayableOn
-		return output
+		# Size of hand, opponent's hand, pile, discard pile and deck.
+		features = [len(hand), len(state.getOppHandRep()), state.getPileRep().size(), len(state.getDiscardRep()), state.getDeckSize()]
+		return StateBlock(features, hand)
+
+	# Returns the action feature: the number of cards in hand playable on
+	# the newly played card(s) after action. A play is a list of cards of one
+	# rank, (None, cards) in the pregame or (rank, count) as encoded by the
+	# Q-learner; a swap, a down card or a pickup plays nothing from the hand.
+	def getActionFeature(self, block, action):
+		if action == "DOWNCARD" or action == []:
+			return 0
+		if isinstance(action, tuple):
+			if isinstance(action[0], int):
+				return block.countPlayableOn(action[0], action[1])
+			if not action[0] == None:
+				return 0
+			action = action[1]
+		return block.countPlayableOn(action[0].rank, len(action))
 
 	def maxCardInHand(self, state):
 		hand = state.getHand()
@@ -3,23 +3,60 @@ import GameBoard as gb
 import util
 import agents
 import time
+import array
+import nullGraphics
+
+# Indexes of the per-game event counters (see Game.getEvents).
+EVENT_PICKUPS = 0		# Pickups with no playable card.
+EVENT_THREE_PICKUPS = 1	# Pickups forced by a 3.
+EVENT_TEN_CLEARS = 2	# Pile clears by a 10.
+EVENT_FOUR_CLEARS = 3	# Pile clears by four of a kind.
+EVENT_CARDS_DRAWN = 4	# Cards drawn from the deck.
+EVENT_SWAPS = 5			# Swaps made in the pregame.
+EVENT_DOWN_WON = 6		# Down cards that were playable.
+EVENT_DOWN_LOST = 7		# Down cards that were not, so the pile was picked up.
+EVENT_MAX_HAND = 8		# Largest hand size reached.
+NUM_EVENTS = 9
+EVENT_NAMES = ["pickups", "three pickups", "ten clears", "four clears", "cards drawn", "swaps", "down cards won", "down cards lost", "largest hand"]
 
 # Represents an instance of a Scheisskopf game. Handles all control related to
 # turn-taking and GameBoard manipulation.
 class Game:
 
-	# Construct players and GameBoard.
-	def __init__(self, playerOneType, playerTwoType, graphics):
+	# Construct players and GameBoard. boardType is the board engine to use:
+	# GameBoard.GameBoard (lists) or BitBoard.BitBoard (bit masks).
+	# If repetitionLimit is given, the game is ended as a draw once the
+	# same position comes up that many times. If graphics is None the game
+	# runs headless: nothing is rendered or printed per turn. rng is the game's
+	# random source (a random.Random, see util.gameRandom), shared by the deal,
+	# the agents and the down card choice; None uses the random module.
+	# deckOrder and firstPlayerID fix the deal and the first player instead
+	# of drawing them from rng (used to replay a deal with seats swapped).
+	# weights are the initial weights of any QLEARNER player (None for zero
+	# weights). Q-learners do not learn during a game; see training.py.
+	def __init__(self, playerOneType, playerTwoType, graphics, boardType=gb.GameBoard, repetitionLimit=None, rng=None, deckOrder=None, firstPlayerID=None, weights=None):
+		if rng == None:
+			rng = random
+		self.rng = rng
 		self.inPregame = True
+		self.headless = graphics == None
+		if self.headless:
+			graphics = nullGraphics.NullGraphics()
 		self.graphics = graphics
+		self.subscribers = dict()	# Maps event type:list of callbacks.
+		self.playerTwoID = 2
+		self.repetitionLimit = repetitionLimit
+		self.positionCounts = dict()	# Maps position hash:number of times seen.
 		
 		# Construct player 1.
 		if playerOneType == "RANDOM":
-			self.playerOne = agents.RandomAgent(1)
+			self.playerOne = agents.RandomAgent(1, self.rng)
 		elif playerOneType == "GREEDY":
 			self.playerOne = agents.GreedyAgent(1)
 		elif playerOneType == "HEURISTIC":
 			self.playerOne = agents.HeuristicAgent(1)
+		elif playerOneType == "QLEARNER":
+			self.playerOne = agents.QLearningAgent(1, weights, self.rng)
 		elif playerOneType == "HUMAN":
 			self.playerOne = agents.HumanAgent(1)
 		else:
@@ -28,35 +65,39 @@ class Game:
 
 		# Construct player 2.
 		if playerTwoType == "RANDOM":
-			self.playerTwo = agents.RandomAgent(self.playerTwoID)
+			self.playerTwo = agents.RandomAgent(self.playerTwoID, self.rng)
 		elif playerTwoType == "GREEDY":
 			self.playerTwo = agents.GreedyAgent(self.playerTwoID)
 		elif playerTwoType == "HEURISTIC":
 			self.playerTwo = agents.HeuristicAgent(self.playerTwoID)
 		elif playerTwoType == "QLEARNER":
-			self.playerTwo = agents.QLearningAgent(self.playerTwoID, initialWeights)
+			self.playerTwo = agents.QLearningAgent(self.playerTwoID, weights, self.rng)
 		else:
 			print "INVALID AGENT TYPE"
 
 		self.players = [self.playerOne, self.playerTwo]
-		self.gameBoard = gb.GameBoard(self.players)
-
-		if self.playerTwo.getType() == "QLearningAgent":
-			hand = self.gameBoard.viewHand(self.playerTwo)
-			upCards = self.gameBoard.viewUpCards(self.playerTwo)
-			playableHand = self.gameBoard.getPlayableHandCards(self.playerTwo)
-			playableUpCards = self.gameBoard.getPlayableUpCards(self.playerTwo)
-			self.state = self.playerTwo.constructState(hand, upCards, playableHand, self.gameBoard.isTerminal())
-		
+		self.gameBoard = boardType(self.players, self.rng, deckOrder)
+		for player in self.players:
+			player.setHandView(self.gameBoard.getHandView(player))
+
 		# pass in the agents to the graphics
 		self.graphics.setAgents(self.players)
 
 		# Choose player to go first randomly.
-		self.activePlayer = random.choice(self.players)
+		if firstPlayerID == None:
+			self.activePlayer = self.rng.choice(self.players)
+		elif firstPlayerID == self.playerOne.getID():
+			self.activePlayer = self.playerOne
+		else:
+			self.activePlayer = self.playerTwo
+		self.gameBoard.setTurn(self.activePlayer.getID())
 
 		self.pileCard = self.gameBoard.peekPile()
 		self.ended = False		# True iff game is over.
 		self.winner = None
+		self.events = array.array("l", [0]*NUM_EVENTS)	# Event counters, indexed by the EVENT_ constants.
+		self.events[EVENT_MAX_HAND] = 3
+		self.recorder = None	# Optional moveLog.GameRecorder.
 
 	#######################################################
 	#######################################################
@@ -93,6 +134,36 @@ class Game:
 	def getActivePlayer(self):
 		return self.activePlayer.getID()
 
+	# Records every move from now on with recorder (a moveLog.GameRecorder).
+	# Call before the first turn.
+	def setRecorder(self, recorder):
+		self.recorder = recorder
+		recorder.start(self)
+
+	# Times the phases of every turn from now on with profiler (a
+	# profiler.TurnProfiler). Without one, nothing is timed.
+	def setProfiler(self, profiler):
+		profiler.attach(self)
+
+	# Returns the event counters, indexed by the EVENT_ constants.
+	def getEvents(self):
+		return self.events
+
+	# Returns the number of times a player picked up the pile.
+	def getNumPickups(self):
+		events = self.events
+		return events[EVENT_PICKUPS] + events[EVENT_THREE_PICKUPS] + events[EVENT_DOWN_LOST]
+
+	# Returns the number of times the pile was cleared.
+	def getNumClears(self):
+		return self.events[EVENT_TEN_CLEARS] + self.events[EVENT_FOUR_CLEARS]
+
+	# Raises the largest hand size to the active player's hand size.
+	def countHandSize(self):
+		handSize = self.gameBoard.getHandSize(self.activePlayer)
+		if handSize > self.events[EVENT_MAX_HAND]:
+			self.events[EVENT_MAX_HAND] = handSize
+
 	# Returns the winner of the game.
 	def getWinner(self):
 		return self.winner
@@ -101,6 +172,43 @@ class Game:
 	def isEnded(self):
 		return self.ended
 
+	# Returns True iff the current position has come up repetitionLimit times.
+	# Each call counts the current position once.
+	def isRepeated(self):
+		positionHash = self.gameBoard.getHash()
+		count = self.positionCounts.get(positionHash, 0) + 1
+		self.positionCounts[positionHash] = count
+		return count >= self.repetitionLimit
+
+	#######################################################
+	#######################################################
+	# OBSERVER METHODS:
+	# Observers subscribe to the events they want; events
+	# nobody subscribed to cost a dict lookup.
+	#   "TURN"    (game) after every turn.
+	#   "PERCEPT" (perceptType, agentID, cardList, handCard)
+	#             whenever percepts are sent to the players.
+	#   "END"     (game) when the game ends.
+	#######################################################
+	#######################################################
+
+	# Calls callback with the event's arguments each time eventType happens.
+	def subscribe(self, eventType, callback):
+		self.subscribers.setdefault(eventType, []).append(callback)
+
+	# Stops calling callback for eventType.
+	def unsubscribe(self, eventType, callback):
+		callbacks = self.subscribers.get(eventType, [])
+		if callback in callbacks:
+			callbacks.remove(callback)
+		if callbacks == []:
+			self.subscribers.pop(eventType, None)
+
+	# Sends an event to its subscribers.
+	def publish(self, eventType, *args):
+		for callback in self.subscribers[eventType]:
+			callback(*args)
+
 	#######################################################
 	#######################################################
 	# MUTATOR METHODS:
@@ -113,26 +221,35 @@ class Game:
 			n += 1
 
 	# Moves the game forward a single turn and changes activePlayer.
+	# Renders before and after the turn unless the game is headless.
 	def takeTurn(self):
-		self.graphics.setGameBoard(self.gameBoard)
-		if not self.gameBoard.peekPile() == None:
-			print self.gameBoard.peekPile().getRank()
-		self.graphics.updateGraphics()		
-		#if not self.activePlayer.getType() == "HumanAgent":
-
-		#	time.sleep(2)		
+		if not self.headless:
+			self.graphics.setGameBoard(self.gameBoard)
+			if not self.gameBoard.peekPile() == None:
+				print self.gameBoard.peekPile().getRank()
+			self.graphics.updateGraphics()
+			#if not self.activePlayer.getType() == "HumanAgent":
+
+			#	time.sleep(2)
+
+		self.playTurn()
+
+		if not self.headless:
+			self.graphics.updateGraphics()
+		if "TURN" in self.subscribers:
+			self.publish("TURN", self)
+		if self.ended and "END" in self.subscribers:
+			self.publish("END", self)
+
+	# The game-core part of a turn: no rendering or printing.
+	def playTurn(self):
 		if self.gameBoard.isTerminal():
 			return
 
-		if self.playerTwo.getType() == "QLearningAgent":
-			hand = self.gameBoard.viewHand(self.playerTwo)
-			upCards = self.gameBoard.viewUpCards(self.playerTwo)
-			playableHand = self.gameBoard.getPlayableHandCards(self.playerTwo)
-			playableUpCards = self.gameBoard.getPlayableUpCards(self.playerTwo)
-			if playableHand == []: 
-				state = self.playerTwo.constructState(hand, upCards, playableUpCards)
-			else:
-				state = self.playerTwo.constructState(hand, upCards, playableHand)
+		# A position that keeps coming back (e.g. an endless pickup loop) is a draw.
+		if not self.repetitionLimit == None and self.isRepeated():
+			self.ended = True
+			return
 
 		# Update pileCard.
 		self.pileCard = self.gameBoard.peekPile()
@@ -140,6 +257,12 @@ class Game:
 		# If there's a ten on the pile, clear and skip activePlayer's turn.
 		if not self.pileCard == None and (self.pileCard.getRank() == 10 or self.gameBoard.topFourSame()):
 			self.gameBoard.clearPile()
+			if self.pileCard.getRank() == 10:
+				self.events[EVENT_TEN_CLEARS] += 1
+			else:
+				self.events[EVENT_FOUR_CLEARS] += 1
+			if not self.recorder == None:
+				self.recorder.recordClear()
 			self.sendPercepts("DISCARD")
 			self.changeActivePlayer()
 			#########################
@@ -152,6 +275,10 @@ class Game:
 		if not self.pileCard == None and self.pileCard.getRank() == 3:
 			self.gameBoard.clearThrees()
 			self.gameBoard.pileToHand(self.activePlayer)
+			self.events[EVENT_THREE_PICKUPS] += 1
+			self.countHandSize()
+			if not self.recorder == None:
+				self.recorder.recordThrees()
 			# Send percepts to all players.
 			self.sendPercepts("PICKUP", self.activePlayer.getID())
 			self.changeActivePlayer()
@@ -185,32 +312,6 @@ class Game:
 			self.changeActivePlayer()
 			self.winner = self.activePlayer.getID()	
 
-		# Update Q-learner.
-		if self.playerTwo.getType() == "QLearningAgent":
-			if self.gameBoard.isTerminal():
-				if self.winner == self.playerTwo:
-					reward = 1
-				elif self.winner == self.playerOne:
-					reward = -1
-				else:
-					reward = 0
-			else:
-				reward = 0
-
-			hand = self.gameBoard.viewHand(self.playerTwo)
-			upCards = self.gameBoard.viewUpCards(self.playerTwo)
-			if hand == []:
-				playableCards = self.gameBoard.getPlayableUpCards(self.playerTwo)
-			else:
-				playableCards = self.gameBoard.getPlayableHandCards(self.playerTwo)
-			nextState = self.playerTwo.constructState(hand, upCards, playableCards)
-			self.playerTwo.update(state, action, nextState, reward)
-			
-		#########################
-		#### UPDATE GRAPHICS ####
-		self.graphics.updateGraphics()
-
-
 	# Hand over turn-taking control.
 	def changeActivePlayer(self):
 		# Hand over turn-taking control.
@@ -218,11 +319,14 @@ class Game:
 			self.activePlayer = self.playerTwo
 		elif self.activePlayer == self.playerTwo:
 			self.activePlayer = self.playerOne
+		self.gameBoard.setTurn(self.activePlayer.getID())
 
 	# Send a certain percept to all players.
 	def sendPercepts(self, perceptType, agentID=None, cardList=None, handCard=None):
 		for player in self.players:
 			player.updateKnowledge(perceptType, agentID, cardList, handCard)
+		if "PERCEPT" in self.subscribers:
+			self.publish("PERCEPT", perceptType, agentID, cardList, handCard)
 
 	# Handles a swap.
 	def swapPlay(self):
@@ -236,12 +340,18 @@ class Game:
 		# If so, submit that action.
 		if upCard == None:
 			self.inPregame = False
+			self.gameBoard.setPregame(False)
+			if not self.recorder == None:
+				self.recorder.recordEndPregame()
 			return (None, self.handCardsPlay(handCards))	
 
 		# Check legality of swap and apply if legal.
 		else:
 			if self.gameBoard.isLegalSwap(upCard, handCards, self.activePlayer):
 				self.gameBoard.applySwap(swap, self.activePlayer)
+				self.events[EVENT_SWAPS] += 1
+				if not self.recorder == None:
+					self.recorder.recordSwap(upCard, handCards)
 				self.sendPercepts("SWAP", self.activePlayer.getID(), upCard, handCards)
 				self.changeActivePlayer()
 				return swap
@@ -254,15 +364,21 @@ class Game:
 		indexList = []
 		for i in range(0, numDownCards):
 			indexList.append(i)
-		index = random.choice(indexList)
+		index = self.rng.choice(indexList)
 		downCard = self.gameBoard.viewDownCards(self.activePlayer).pop(index)
 		self.gameBoard.downCardToPile(self.activePlayer, downCard)
+		if not self.recorder == None:
+			self.recorder.recordDownCard(downCard)
 		self.sendPercepts("PLAY", self.activePlayer.getID(), [downCard])
 				
 		# If the card is not playable on the pile, pick it all up.
 		if not downCard.isPlayableOn(self.pileCard):
 			self.gameBoard.pileToHand(self.activePlayer)
+			self.events[EVENT_DOWN_LOST] += 1
+			self.countHandSize()
 			self.sendPercepts("PICKUP", self.activePlayer.getID())
+		else:
+			self.events[EVENT_DOWN_WON] += 1
 		self.changeActivePlayer()
 
 	# Handles the playing of an up card.
@@ -274,6 +390,10 @@ class Game:
 		if action == []:
 			if playableCards == []:
 				self.gameBoard.pileToHand(self.activePlayer)
+				self.events[EVENT_PICKUPS] += 1
+				self.countHandSize()
+				if not self.recorder == None:
+					self.recorder.recordPickup()
 				self.sendPercepts("PICKUP", self.activePlayer.getID())
 				self.changeActivePlayer()
 				return []
@@ -284,6 +404,8 @@ class Game:
 		# Check to see if action is valid. If so, play cards.
 		if self.gameBoard.isLegalUpCardPlay(action, self.activePlayer):
 			self.gameBoard.upCardsToPile(self.activePlayer, action)
+			if not self.recorder == None:
+				self.recorder.recordPlay(action)
 			self.sendPercepts("PLAY", self.activePlayer.getID(), action)
 			self.changeActivePlayer()
 			return action
@@ -303,6 +425,10 @@ class Game:
 		if action == []:
 			if playableCards == []:
 				self.gameBoard.pileToHand(self.activePlayer)
+				self.events[EVENT_PICKUPS] += 1
+				self.countHandSize()
+				if not self.recorder == None:
+					self.recorder.recordPickup()
 				self.sendPercepts("PICKUP", self.activePlayer.getID())
 				self.changeActivePlayer()
 				return []
@@ -313,6 +439,9 @@ class Game:
 		# Check to see if action is valid. If so, play cards.
 		if self.gameBoard.isLegalHandCardPlay(action, self.activePlayer):
 			numDrawn = self.gameBoard.handToPile(self.activePlayer, action)
+			self.events[EVENT_CARDS_DRAWN] += numDrawn
+			if not self.recorder == None:
+				self.recorder.recordPlay(action)
 			self.sendPercepts("PLAY", self.activePlayer.getID(), action)
 			self.sendPercepts("DRAW", self.activePlayer.getID(), numDrawn)
 			self.changeActivePlayer()
@@ -0,0 +1,283 @@
+import GameBoard as gb
+import util
+import struct
+
+#######################################################
+#######################################################
+# moveLog.py
+#
+# A compact binary log of a game and an engine that replays
+# it on a board without agents. A log is:
+#   version (1 byte), first player (1 byte),
+#   deck order as a Lehmer code (29 bytes),
+#   one code per move or pile effect (most are one byte),
+#   END and the 8-byte position hash of the final board.
+# Draws from the deck follow from the deck order, so they
+# are not stored.
+#######################################################
+#######################################################
+
+VERSION = 1
+DECK_BYTES = 29		# 52! < 2**232.
+
+# Move codes. A code below PLAY_MULTI plays the single card with that index.
+PLAY_MULTI = 52		# PLAY_MULTI + (n-2), then n card indices: play n cards.
+PICKUP = 55			# Pick up the pile.
+DOWN = 56			# Then the card index: play that down card. The card is
+					# stored rather than its position, which depends on the engine.
+SWAP = 57			# Then the up card and hand card indices: swap them.
+END_PREGAME = 58	# The active player stops swapping and plays.
+END = 59			# Then the 8-byte final position hash.
+CLEAR = 60			# A 10 or four of a kind cleared the pile.
+THREES = 61			# 3s were discarded and the active player picked up the pile.
+
+# Returns the Lehmer code of a deck order (a list of all 52 cards) as an integer.
+def encodeDeck(deckOrder):
+	remaining = range(0, len(util.CARDS))
+	code = 0
+	for card in deckOrder:
+		position = remaining.index(card.index)
+		code = code*len(remaining) + position
+		del remaining[position]
+	return code
+
+# Returns the deck order encoded by encodeDeck.
+def decodeDeck(code):
+	numCards = len(util.CARDS)
+	positions = []
+	for base in range(1, numCards + 1):
+		positions.append(code%base)
+		code /= base
+	positions.reverse()
+	remaining = range(0, numCards)
+	deckOrder = []
+	for position in positions:
+		deckOrder.append(util.CARDS[remaining.pop(position)])
+	return deckOrder
+
+# Returns integer n as a big endian string of numBytes bytes.
+def packInteger(n, numBytes):
+	return "".join([chr((n >> (8*(numBytes - 1 - i))) & 0xFF) for i in range(0, numBytes)])
+
+# Returns the integer of a big endian byte string.
+def unpackInteger(data):
+	n = 0
+	for byte in data:
+		n = (n << 8) | ord(byte)
+	return n
+
+# Records the moves of a game.Game as they are made. Attach it with
+# Game.setRecorder before the first turn.
+class GameRecorder:
+
+	def __init__(self):
+		self.game = None
+		self.moves = []
+
+	# Starts recording game: stores the deck order and first player.
+	def start(self, game):
+		self.game = game
+		code = encodeDeck(game.getGameBoard().getDeckOrder())
+		self.header = chr(VERSION) + chr(game.getActivePlayer()) + packInteger(code, DECK_BYTES)
+		self.moves = []
+
+	# Records a play of cardList.
+	def recordPlay(self, cardList):
+		if len(cardList) == 1:
+			self.moves.append(chr(cardList[0].index))
+		else:
+			self.moves.append(chr(PLAY_MULTI + len(cardList) - 2) + "".join([chr(card.index) for card in cardList]))
+
+	# Records a pickup of the pile.
+	def recordPickup(self):
+		self.moves.append(chr(PICKUP))
+
+	# Records a play of the down card downCard.
+	def recordDownCard(self, downCard):
+		self.moves.append(chr(DOWN) + chr(downCard.index))
+
+	# Records a swap of upCard and handCard.
+	def recordSwap(self, upCard, handCard):
+		self.moves.append(chr(SWAP) + chr(upCard.index) + chr(handCard.index))
+
+	# Records the end of the pregame.
+	def recordEndPregame(self):
+		self.moves.append(chr(END_PREGAME))
+
+	# Records a clear of the pile by a 10 or four of a kind.
+	def recordClear(self):
+		self.moves.append(chr(CLEAR))
+
+	# Records a discard of 3s and the forced pickup that follows.
+	def recordThrees(self):
+		self.moves.append(chr(THREES))
+
+	# Returns the log of the game so far, ending in the current position hash.
+	def getLog(self):
+		endHash = struct.pack("<Q", self.game.getGameBoard().getHash())
+		return self.header + "".join(self.moves) + chr(END) + endHash
+
+# Stands in for an agent on a replayed board, which only needs IDs.
+class Seat:
+
+	def __init__(self, agentID):
+		self.agentID = agentID
+
+	def getID(self):
+		return self.agentID
+
+# Replays a log on a board, following the turn logic of game.Game without
+# agents. boardType is GameBoard.GameBoard or BitBoard.BitBoard.
+class Replay:
+
+	def __init__(self, log, boardType=gb.GameBoard):
+		if not ord(log[0]) == VERSION:
+			raise ValueError("Unknown move log version " + str(ord(log[0])))
+		self.log = log
+		self.position = 2 + DECK_BYTES
+		self.players = [Seat(1), Seat(2)]
+		deckOrder = decodeDeck(unpackInteger(log[2:self.position]))
+		self.gameBoard = boardType(self.players, None, deckOrder)
+		self.activePlayer = self.players[ord(log[1]) - 1]
+		self.gameBoard.setTurn(self.activePlayer.getID())
+		self.inPregame = True
+		self.winner = None
+		self.endHash = None
+
+	def getGameBoard(self):
+		return self.gameBoard
+
+	# Returns the winner's ID, or None if the game was not won.
+	def getWinner(self):
+		return self.winner
+
+	# Returns the next byte of the log as an integer.
+	def readByte(self):
+		byte = ord(self.log[self.position])
+		self.position += 1
+		return byte
+
+	# Reads the cards of a play whose code is code.
+	def readPlay(self, code):
+		if code < PLAY_MULTI:
+			return [util.CARDS[code]]
+		return [util.CARDS[self.readByte()] for i in range(0, code - PLAY_MULTI + 2)]
+
+	# Hands the turn to the other player.
+	def changeActivePlayer(self):
+		if self.activePlayer == self.players[0]:
+			self.activePlayer = self.players[1]
+		else:
+			self.activePlayer = self.players[0]
+		self.gameBoard.setTurn(self.activePlayer.getID())
+
+	# Plays the whole log. Returns the final board, and raises ValueError if
+	# its position hash differs from the one recorded.
+	def run(self):
+		while self.step():
+			pass
+		if not self.endHash == None and not self.gameBoard.getHash() == self.endHash:
+			raise ValueError("Replayed position does not match the log")
+		return self.gameBoard
+
+	# Plays one turn, as Game.playTurn does. Returns False when the log ends.
+	# Raises ValueError if the log does not fit the board.
+	def step(self):
+		gameBoard = self.gameBoard
+		if self.position >= len(self.log):
+			return False
+		code = self.readByte()
+		if code == END:
+			self.endHash = struct.unpack("<Q", self.log[self.position:self.position + 8])[0]
+			self.position += 8
+			return False
+
+		# Pile effects take the turn, as in Game.playTurn.
+		pileCard = gameBoard.peekPile()
+		clears = not pileCard == None and (pileCard.getRank() == 10 or gameBoard.topFourSame())
+		burns = not clears and not pileCard == None and pileCard.getRank() == 3
+		if not (code == CLEAR) == clears or not (code == THREES) == burns:
+			raise ValueError("Move log does not match the pile at byte " + str(self.position - 1))
+		if code == CLEAR:
+			gameBoard.clearPile()
+			self.changeActivePlayer()
+			return True
+		if code == THREES:
+			gameBoard.clearThrees()
+			gameBoard.pileToHand(self.activePlayer)
+			self.changeActivePlayer()
+			return True
+		ID = self.activePlayer.getID()
+
+		if code == SWAP:
+			upCard = util.CARDS[self.readByte()]
+			handCard = util.CARDS[self.readByte()]
+			gameBoard.applySwap((upCard, handCard), self.activePlayer)
+			self.changeActivePlayer()
+			return True
+		if code == END_PREGAME:
+			self.inPregame = False
+			gameBoard.setPregame(False)
+			return True
+
+		if code == DOWN:
+			downCard = util.CARDS[self.readByte()]
+			gameBoard.downCardToPile(self.activePlayer, downCard)
+			if not downCard.isPlayableOn(pileCard):
+				gameBoard.pileToHand(self.activePlayer)
+		elif code == PICKUP:
+			gameBoard.pileToHand(self.activePlayer)
+		elif gameBoard.upCardsPlayable(ID):
+			gameBoard.upCardsToPile(self.activePlayer, self.readPlay(code))
+		else:
+			gameBoard.handToPile(self.activePlayer, self.readPlay(code))
+		self.changeActivePlayer()
+
+		if gameBoard.isTerminal():
+			self.changeActivePlayer()
+			self.winner = self.activePlayer.getID()
+		return True
+
+# Replays a log and returns the final board (see Replay.run).
+def replay(log, boardType=gb.GameBoard):
+	return Replay(log, boardType).run()
+
+# Writes a list of logs to path, each prefixed by its length as a varint.
+def writeLogs(path, logs):
+	f = open(path, "wb")
+	try:
+		for log in logs:
+			f.write(encodeLength(len(log)) + log)
+	finally:
+		f.close()
+
+# Returns the list of logs in a file written by writeLogs.
+def readLogs(path):
+	f = open(path, "rb")
+	try:
+		data = f.read()
+	finally:
+		f.close()
+	logs = []
+	position = 0
+	while position < len(data):
+		length = 0
+		shift = 0
+		while True:
+			byte = ord(data[position])
+			position += 1
+			length |= (byte & 0x7F) << shift
+			shift += 7
+			if byte < 0x80:
+				break
+		logs.append(data[position:position + length])
+		position += length
+	return logs
+
+# Returns n as an unsigned LEB128 varint.
+def encodeLength(n):
+	output = ""
+	while n >= 0x80:
+		output += chr((n & 0x7F) | 0x80)
+		n >>= 7
+	return output + chr(n)
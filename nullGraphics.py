@@ -0,0 +1,24 @@
+#######################################################
+#######################################################
+# nullGraphics.py
+#
+# A renderer with the same interface as graphics.Graphics
+# that draws nothing. Used for headless simulation: it does
+# not import Tkinter, so it works without a display.
+#######################################################
+#######################################################
+
+class NullGraphics:
+
+	def __init__(self):
+		self.theGameBoard = None
+		self.theAgents = []
+
+	def setGameBoard(self, newGameBoard):
+		self.theGameBoard = newGameBoard
+
+	def setAgents(self, newAgents):
+		self.theAgents = list(newAgents)
+
+	def updateGraphics(self):
+		return
@@ -0,0 +1,161 @@
+import timeit
+import json
+
+#######################################################
+#######################################################
+# profiler.py
+#
+# Times the phases of a game's turns: agent decisions,
+# legality queries, board mutations, percepts and
+# rendering. A profiler wraps the methods of one game's
+# objects when attached, so a game without one runs
+# exactly as before and pays nothing.
+#######################################################
+#######################################################
+
+PHASE_METHODS = [
+	("decision", "players", ["chooseHandCard", "chooseUpCard", "chooseSwap", "chooseDownCard"]),
+	("legality", "board", ["isLegalHandCardPlay", "isLegalUpCardPlay", "isLegalSwap", "getPlayableHandCards", "getPlayableUpCards", "downCardsPlayable", "upCardsPlayable"]),
+	("mutation", "board", ["handToPile", "pileToHand", "upCardsToPile", "downCardToPile", "clearPile", "clearThrees", "applySwap", "draw"]),
+	("percepts", "game", ["sendPercepts"]),
+	("rendering", "graphics", ["updateGraphics"]),
+]
+PHASES = [phase for phase, owner, names in PHASE_METHODS]
+TURN = "turn"	# The whole of Game.takeTurn, which contains the other phases.
+
+# Accumulates time and call counts per phase and per agent over any number of games.
+class TurnProfiler:
+
+	def __init__(self):
+		self.totals = {}	# (phase, agent) to [calls, seconds].
+		self.depth = 0		# Phase calls in progress; nested calls are not timed again.
+		self.game = None
+
+	# Wraps the methods of game, its board, agents and renderer. Every call
+	# is charged to the agent whose turn it is.
+	def attach(self, game):
+		self.game = game
+		owners = {"players": game.getPlayers(), "board": [game.getGameBoard()], "game": [game], "graphics": [game.graphics]}
+		for phase, owner, names in PHASE_METHODS:
+			for target in owners[owner]:
+				for name in names:
+					if hasattr(target, name):
+						setattr(target, name, self.wrap(phase, getattr(target, name)))
+		game.takeTurn = self.wrapTurn(game.takeTurn)
+
+	# Returns the label of the agent whose turn it is.
+	def activeAgent(self):
+		player = self.game.activePlayer
+		return str(player.getID()) + ":" + player.getType()
+
+	# Adds one call of seconds to a phase.
+	def charge(self, phase, agent, seconds):
+		key = (phase, agent)
+		total = self.totals.get(key)
+		if total == None:
+			self.totals[key] = [1, seconds]
+		else:
+			total[0] += 1
+			total[1] += seconds
+
+	# Returns method timed as phase. Calls made from inside another timed
+	# call (e.g. the draw in handToPile) count towards the outer one only.
+	def wrap(self, phase, method):
+		timer = timeit.default_timer
+		def timed(*args):
+			if self.depth > 0:
+				return method(*args)
+			agent = self.activeAgent()
+			self.depth += 1
+			start = timer()
+			try:
+				return method(*args)
+			finally:
+				self.charge(phase, agent, timer() - start)
+				self.depth -= 1
+		return timed
+
+	# Returns takeTurn timed as a whole turn.
+	def wrapTurn(self, takeTurn):
+		timer = timeit.default_timer
+		def timed():
+			agent = self.activeAgent()
+			start = timer()
+			try:
+				return takeTurn()
+			finally:
+				self.charge(TURN, agent, timer() - start)
+		return timed
+
+	# Adds the totals of another profiler.
+	def merge(self, other):
+		for key, (calls, seconds) in other.totals.items():
+			total = self.totals.get(key)
+			if total == None:
+				self.totals[key] = [calls, seconds]
+			else:
+				total[0] += calls
+				total[1] += seconds
+
+	# Returns [calls, seconds] for a phase, summed over agents, or for one agent.
+	def getTotal(self, phase, agent=None):
+		calls = 0
+		seconds = 0.0
+		for (keyPhase, keyAgent), total in self.totals.items():
+			if keyPhase == phase and (agent == None or keyAgent == agent):
+				calls += total[0]
+				seconds += total[1]
+		return [calls, seconds]
+
+	# Returns the agent labels seen, sorted.
+	def getAgents(self):
+		return sorted(set([agent for phase, agent in self.totals.keys()]))
+
+	# Returns the totals as a dict for writing out: phase to agent to
+	# {"calls", "seconds"}, with an "all" entry summed over agents.
+	def toDict(self):
+		output = {}
+		for phase in [TURN] + PHASES:
+			output[phase] = {}
+			for agent in self.getAgents() + [None]:
+				calls, seconds = self.getTotal(phase, agent)
+				if calls > 0:
+					output[phase][agent or "all"] = {"calls": calls, "seconds": seconds}
+		return output
+
+	# Writes toDict to path as JSON.
+	def write(self, path):
+		f = open(path, "w")
+		try:
+			json.dump(self.toDict(), f, indent=1, sort_keys=True)
+		finally:
+			f.close()
+
+	# Prints each phase's calls, time, mean time per call and share of turn
+	# time, overall and per agent. "other" is turn time outside every phase.
+	def printReport(self):
+		print "\n"
+		print "##############################"
+		print "TURN PROFILE:"
+		print "##############################"
+		for agent in [None] + self.getAgents():
+			turnCalls, turnSeconds = self.getTotal(TURN, agent)
+			if agent == None:
+				print "All agents (" + str(turnCalls) + " turns, " + str(round(turnSeconds, 3)) + "s):"
+			else:
+				print "Agent " + agent + " (" + str(turnCalls) + " turns, " + str(round(turnSeconds, 3)) + "s):"
+			inPhases = 0.0
+			for phase in PHASES:
+				calls, seconds = self.getTotal(phase, agent)
+				if calls == 0:
+					continue
+				inPhases += seconds
+				print "  " + phase.ljust(10) + str(calls).rjust(10) + " calls" + (str(round(seconds, 3)) + "s").rjust(10) + (str(round(1e6*seconds/calls, 2)) + "us/call").rjust(16) + self.share(seconds, turnSeconds)
+			if turnSeconds > 0:
+				print "  " + "other".ljust(10) + "".rjust(16) + (str(round(max(0.0, turnSeconds - inPhases), 3)) + "s").rjust(10) + "".rjust(16) + self.share(max(0.0, turnSeconds - inPhases), turnSeconds)
+
+	# Returns seconds as a percentage of turnSeconds, for printReport.
+	def share(self, seconds, turnSeconds):
+		if turnSeconds == 0:
+			return ""
+		return (str(round(100*seconds/turnSeconds, 1)) + "%").rjust(9)
@@ -0,0 +1,75 @@
+import featureExtractor as fe
+import numpy as np
+
+#######################################################
+#######################################################
+# replayBuffer.py
+#
+# A fixed-capacity ring buffer of Q-learning transitions
+# in preallocated NumPy arrays, sampled in minibatches for
+# QLearningAgent.learnBatch. Memory is allocated once:
+# capacity*(2*NUM_FEATURES + 4) numbers, with the oldest
+# transitions overwritten when the buffer is full.
+#
+# Only the last feature depends on the action (see
+# featureExtractor.NUM_STATE_FEATURES), so the best next
+# Q value under any weights follows from the next state's
+# features and the range of the action feature over its
+# legal actions; those are stored instead of every next
+# action's features.
+#######################################################
+#######################################################
+
+class ReplayBuffer:
+
+	# seed seeds the buffer's own sampling random source.
+	def __init__(self, capacity, seed=None):
+		self.capacity = capacity
+		self.size = 0
+		self.position = 0	# Row the next transition is written to.
+		self.features = np.zeros((capacity, fe.NUM_FEATURES))
+		self.rewards = np.zeros(capacity)
+		self.nextStateFeatures = np.zeros((capacity, fe.NUM_STATE_FEATURES))
+		self.nextActionRanges = np.zeros((capacity, 2))	# Least and greatest action feature in the next state.
+		self.terminals = np.zeros(capacity, dtype=bool)
+		self.rng = np.random.RandomState(seed)
+
+	def getSize(self):
+		return self.size
+
+	def getCapacity(self):
+		return self.capacity
+
+	# Adds one transition as recorded by QLearningAgent: the features of the
+	# action taken, those of every legal action in the next state ([] if the
+	# game ended) and the reward.
+	def add(self, features, nextFeatureRows, reward):
+		i = self.position
+		self.features[i] = features
+		self.rewards[i] = reward
+		if nextFeatureRows == []:
+			self.terminals[i] = True
+			self.nextStateFeatures[i] = 0.0
+			self.nextActionRanges[i] = 0.0
+		else:
+			self.terminals[i] = False
+			self.nextStateFeatures[i] = nextFeatureRows[0][:fe.NUM_STATE_FEATURES]
+			actionFeatures = [row[fe.NUM_STATE_FEATURES] for row in nextFeatureRows]
+			self.nextActionRanges[i, 0] = min(actionFeatures)
+			self.nextActionRanges[i, 1] = max(actionFeatures)
+		self.position = (i + 1)%self.capacity
+		self.size = min(self.size + 1, self.capacity)
+
+	# Adds a list of transitions in order.
+	def addAll(self, transitions):
+		for features, nextFeatureRows, reward in transitions:
+			self.add(features, nextFeatureRows, reward)
+
+	# Returns batchSize transitions drawn uniformly with replacement, as the
+	# arrays (features, rewards, nextStateFeatures, nextActionRanges,
+	# terminals) taken by QLearningAgent.learnBatch.
+	def sample(self, batchSize):
+		if self.size == 0:
+			raise ValueError("Cannot sample from an empty replay buffer")
+		indices = self.rng.randint(0, self.size, batchSize)
+		return (self.features[indices], self.rewards[indices], self.nextStateFeatures[indices], self.nextActionRanges[indices], self.terminals[indices])
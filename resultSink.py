@@ -0,0 +1,125 @@
+import struct
+import os
+
+#######################################################
+#######################################################
+# resultSink.py
+#
+# Streams one fixed-width binary record per finished game
+# to a file, so experiment results can be loaded for
+# analysis instead of scraped from printed output. The
+# file is a 64-byte header followed by the records; with
+# NumPy installed, loadResults maps it as a structured
+# array.
+#######################################################
+#######################################################
+
+MAGIC = "SCHRES\x00\x00"
+VERSION = 1
+HEADER_FORMAT = "<8sII48x"		# Magic, version, record size, padding.
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# One record per game, little endian with no padding:
+# seed, duration, trial, turns, pickups, clears, agent one, agent two, winner.
+RECORD_FORMAT = "<QdIIIIBBb"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+FIELDS = [("seed", "<u8"), ("duration", "<f8"), ("trial", "<u4"), ("turns", "<u4"), ("pickups", "<u4"), ("clears", "<u4"), ("agentOne", "u1"), ("agentTwo", "u1"), ("winner", "i1")]
+
+# Codes for agent types in the agentOne/agentTwo columns (0 is unknown).
+AGENT_CODES = {"RANDOM": 1, "GREEDY": 2, "HEURISTIC": 3, "QLEARNER": 4}
+AGENT_NAMES = dict([(code, name) for name, code in AGENT_CODES.items()])
+
+# Returns the code of an agent type string.
+def agentCode(agentType):
+	return AGENT_CODES.get(agentType, 0)
+
+# Returns the agent type string of a code.
+def agentName(code):
+	return AGENT_NAMES.get(code, "UNKNOWN")
+
+# Appends game records to a result file. The header is written when the
+# file is new; an existing file must have the same record layout. Records
+# are buffered and written batchSize at a time, so flush or close the sink
+# when done.
+class ResultSink:
+
+	def __init__(self, path, batchSize=1024):
+		self.path = path
+		self.batchSize = batchSize
+		self.buffer = []
+		if os.path.exists(path) and os.path.getsize(path) > 0:
+			readHeader(path)
+			self.file = open(path, "ab")
+		else:
+			self.file = open(path, "wb")
+			self.file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, RECORD_SIZE))
+			self.file.flush()
+
+	# Adds the record of one game. winner is 1 or 2 for agentOne or
+	# agentTwo, or None for a draw; duration is in seconds.
+	def write(self, seed, trial, agentOne, agentTwo, winner, turns, pickups, clears, duration):
+		if winner == None:
+			winner = 0
+		self.buffer.append(struct.pack(RECORD_FORMAT, seed, duration, trial, turns, pickups, clears, agentCode(agentOne), agentCode(agentTwo), winner))
+		if len(self.buffer) >= self.batchSize:
+			self.flush()
+
+	# Writes the buffered records to the file.
+	def flush(self):
+		if self.buffer == []:
+			return
+		self.file.write("".join(self.buffer))
+		self.file.flush()
+		self.buffer = []
+
+	# Flushes and closes the file.
+	def close(self):
+		self.flush()
+		self.file.close()
+
+# Checks the header of a result file and returns its version. Raises
+# ValueError if the file is not a result file with this record layout.
+def readHeader(path):
+	f = open(path, "rb")
+	try:
+		header = f.read(HEADER_SIZE)
+	finally:
+		f.close()
+	if len(header) < HEADER_SIZE:
+		raise ValueError(path + " is too short to be a result file")
+	magic, version, recordSize = struct.unpack(HEADER_FORMAT, header)
+	if not magic == MAGIC:
+		raise ValueError(path + " is not a result file")
+	if not version == VERSION or not recordSize == RECORD_SIZE:
+		raise ValueError(path + " has record layout version " + str(version) + ", expected " + str(VERSION))
+	return version
+
+# Returns the number of complete records in a result file.
+def countRecords(path):
+	return (os.path.getsize(path) - HEADER_SIZE)/RECORD_SIZE
+
+# Yields the records of a result file as tuples in FIELDS order, with agent
+# codes and winner 0 for a draw. Needs no NumPy.
+def readRecords(path):
+	readHeader(path)
+	f = open(path, "rb")
+	try:
+		f.seek(HEADER_SIZE)
+		while True:
+			data = f.read(RECORD_SIZE)
+			if len(data) < RECORD_SIZE:
+				break
+			yield struct.unpack(RECORD_FORMAT, data)
+	finally:
+		f.close()
+
+# Maps a result file as a read-only NumPy structured array with FIELDS
+# columns. A partly written last record is left out.
+def loadResults(path):
+	import numpy as np
+	readHeader(path)
+	dtype = np.dtype(FIELDS)
+	numRecords = countRecords(path)
+	if numRecords == 0:
+		return np.zeros(0, dtype)
+	return np.memmap(path, dtype, "r", HEADER_SIZE, (numRecords,))
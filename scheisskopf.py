@@ -1,10 +1,16 @@
+import sys
 import experiment as ex
-import graphics as gr
 
 # Main method used for testing.
+# Pass --headless to run without a display.
 if __name__ == '__main__':
 
-	theGraphics = gr.Graphics() 
+	if "--headless" in sys.argv:
+		theGraphics = None
+	else:
+		# graphics builds its Tk root on import, so only import it when needed.
+		import graphics as gr
+		theGraphics = gr.Graphics() 
 	experiment = ex.Experiment(1, "GREEDY", "RANDOM", False, theGraphics)
 	experiment.run()
 
@@ -0,0 +1,132 @@
+import math
+
+#######################################################
+#######################################################
+# sequential.py
+#
+# Stopping rules for experiments that end as soon as the
+# result is clear instead of after a fixed number of games.
+# A rule is fed one game at a time (the winner: 1, 2 or None
+# for a draw) and says when enough games have been played.
+#######################################################
+#######################################################
+
+# Wald's sequential probability ratio test on player 1's share of the
+# decisive games. H0 is that the share is p0, H1 that it is p1; alpha and
+# beta are the error rates for wrongly accepting H1 and H0. Draws carry no
+# information about the share and are skipped.
+class SPRT:
+
+	def __init__(self, p0=0.5, p1=0.55, alpha=0.05, beta=0.05):
+		self.p0 = p0
+		self.p1 = p1
+		self.alpha = alpha
+		self.beta = beta
+		self.lowerBound = math.log(beta/(1 - alpha))
+		self.upperBound = math.log((1 - beta)/alpha)
+		self.winStep = math.log(p1/p0)
+		self.lossStep = math.log((1 - p1)/(1 - p0))
+		self.llr = 0.0
+		self.games = 0
+
+	# Adds the result of one game.
+	def addResult(self, winner):
+		self.games += 1
+		if winner == 1:
+			self.llr += self.winStep
+		elif winner == 2:
+			self.llr += self.lossStep
+
+	# Returns True when the log likelihood ratio has crossed either bound.
+	def isDone(self):
+		return self.llr <= self.lowerBound or self.llr >= self.upperBound
+
+	# Returns "H1", "H0" or None if the test has not finished.
+	def getDecision(self):
+		if self.llr >= self.upperBound:
+			return "H1"
+		if self.llr <= self.lowerBound:
+			return "H0"
+		return None
+
+	# Returns the lines describing the state of the test.
+	def describe(self):
+		lines = ["SPRT: H0 p=" + str(self.p0) + " vs. H1 p=" + str(self.p1) + " (alpha=" + str(self.alpha) + ", beta=" + str(self.beta) + ")"]
+		lines.append("Log likelihood ratio: " + str(round(self.llr, 4)) + " in [" + str(round(self.lowerBound, 4)) + ", " + str(round(self.upperBound, 4)) + "]")
+		decision = self.getDecision()
+		if decision == "H1":
+			lines.append("Decision: accept H1 (player 1 share >= " + str(self.p1) + ")")
+		elif decision == "H0":
+			lines.append("Decision: accept H0 (player 1 share <= " + str(self.p0) + ")")
+		else:
+			lines.append("Decision: none (reached the game cap)")
+		return lines
+
+# Stops once the confidence interval on the difference between player 1's and
+# player 2's win rates is narrower than +/- halfWidth. z sets the confidence
+# level (1.96 for 95%). No decision is made before minGames games, so an
+# early run of identical results cannot give a zero width interval.
+class ConfidenceStop:
+
+	def __init__(self, halfWidth=0.05, z=1.96, minGames=30):
+		self.halfWidth = halfWidth
+		self.z = z
+		self.minGames = minGames
+		self.games = 0
+		self.total = 0.0	# Sum and sum of squares of the per-game scores
+		self.totalSquares = 0.0	# (1 for a player 1 win, -1 for a loss, 0 for a draw).
+
+	# Adds the result of one game.
+	def addResult(self, winner):
+		self.games += 1
+		if winner == 1:
+			score = 1
+		elif winner == 2:
+			score = -1
+		else:
+			score = 0
+		self.total += score
+		self.totalSquares += score*score
+
+	# Returns the mean score, which estimates the win rate difference.
+	def getMean(self):
+		return self.total/self.games
+
+	# Returns the current half width of the confidence interval.
+	def getHalfWidth(self):
+		if self.games < 2:
+			return float("inf")
+		mean = self.getMean()
+		variance = max(0.0, (self.totalSquares - self.games*mean*mean)/(self.games - 1))
+		return self.z*math.sqrt(variance/self.games)
+
+	# Returns True when the interval is narrow enough.
+	def isDone(self):
+		return self.games >= self.minGames and self.getHalfWidth() <= self.halfWidth
+
+	# Returns "P1" or "P2" if the interval excludes no difference, "TIE"
+	# if it does not, or None if the interval is not yet narrow enough.
+	def getDecision(self):
+		if not self.isDone():
+			return None
+		mean = self.getMean()
+		halfWidth = self.getHalfWidth()
+		if mean - halfWidth > 0:
+			return "P1"
+		if mean + halfWidth < 0:
+			return "P2"
+		return "TIE"
+
+	# Returns the lines describing the state of the rule.
+	def describe(self):
+		lines = ["Confidence stop: half width <= " + str(self.halfWidth) + " (z=" + str(self.z) + ")"]
+		if self.games > 0:
+			mean = self.getMean()
+			halfWidth = self.getHalfWidth()
+			lines.append("Win rate difference: " + str(round(mean, 4)) + " +/- " + str(round(halfWidth, 4)))
+		decision = self.getDecision()
+		if decision == None:
+			lines.append("Decision: none (reached the game cap)")
+		else:
+			lines.append("Decision: " + decision)
+		return lines
@@ -0,0 +1,321 @@
+import math
+import array
+
+#######################################################
+#######################################################
+# stats.py
+#
+# Streaming summary statistics for experiments. Every
+# accumulator takes one value at a time in constant memory
+# and can be merged with another of its kind, so workers
+# and shards can each keep their own and combine them.
+#######################################################
+#######################################################
+
+# Running count, mean, variance, minimum and maximum of a stream of numbers
+# (Welford's method; merged with Chan et al.'s pairwise update).
+class RunningStats:
+
+	def __init__(self):
+		self.count = 0
+		self.mean = 0.0
+		self.m2 = 0.0	# Sum of squared differences from the mean.
+		self.minimum = None
+		self.maximum = None
+
+	# Adds one value.
+	def add(self, value):
+		self.count += 1
+		delta = value - self.mean
+		self.mean += delta/self.count
+		self.m2 += delta*(value - self.mean)
+		if self.minimum == None or value < self.minimum:
+			self.minimum = value
+		if self.maximum == None or value > self.maximum:
+			self.maximum = value
+
+	# Adds the values summarized by other.
+	def merge(self, other):
+		if other.count == 0:
+			return
+		if self.count == 0:
+			self.count = other.count
+			self.mean = other.mean
+			self.m2 = other.m2
+			self.minimum = other.minimum
+			self.maximum = other.maximum
+			return
+		count = self.count + other.count
+		delta = other.mean - self.mean
+		self.mean += delta*other.count/count
+		self.m2 += other.m2 + delta*delta*self.count*other.count/count
+		self.count = count
+		self.minimum = min(self.minimum, other.minimum)
+		self.maximum = max(self.maximum, other.maximum)
+
+	def getCount(self):
+		return self.count
+
+	def getMean(self):
+		return self.mean
+
+	def getMin(self):
+		return self.minimum
+
+	def getMax(self):
+		return self.maximum
+
+	# Returns the sample variance, or 0 for fewer than two values.
+	def getVariance(self):
+		if self.count < 2:
+			return 0.0
+		return self.m2/(self.count - 1)
+
+	# Returns the standard error of the mean.
+	def getStdError(self):
+		if self.count == 0:
+			return 0.0
+		return math.sqrt(self.getVariance()/self.count)
+
+# Count, sum, sum of squares, minimum and maximum of a stream of integers,
+# kept exactly. The mean and variance are worked out from the sums, so
+# merging gives the same result in any order and however the values were
+# split up.
+class IntegerStats:
+
+	def __init__(self):
+		self.count = 0
+		self.total = 0
+		self.squares = 0	# Sum of squared values.
+		self.minimum = None
+		self.maximum = None
+
+	# Adds one value.
+	def add(self, value):
+		self.count += 1
+		self.total += value
+		self.squares += value*value
+		if self.minimum == None or value < self.minimum:
+			self.minimum = value
+		if self.maximum == None or value > self.maximum:
+			self.maximum = value
+
+	# Adds the values summarized by other.
+	def merge(self, other):
+		if other.count == 0:
+			return
+		self.count += other.count
+		self.total += other.total
+		self.squares += other.squares
+		if self.minimum == None or other.minimum < self.minimum:
+			self.minimum = other.minimum
+		if self.maximum == None or other.maximum > self.maximum:
+			self.maximum = other.maximum
+
+	def getCount(self):
+		return self.count
+
+	def getTotal(self):
+		return self.total
+
+	def getMean(self):
+		if self.count == 0:
+			return 0.0
+		return self.total/float(self.count)
+
+	def getMin(self):
+		return self.minimum
+
+	def getMax(self):
+		return self.maximum
+
+	# Returns the sample variance, or 0 for fewer than two values.
+	def getVariance(self):
+		if self.count < 2:
+			return 0.0
+		return (self.count*self.squares - self.total*self.total)/float(self.count*(self.count - 1))
+
+	# Returns the standard error of the mean.
+	def getStdError(self):
+		if self.count == 0:
+			return 0.0
+		return math.sqrt(self.getVariance()/self.count)
+
+# Histogram of non-negative integers with one bucket per value up to
+# maxValue and a single overflow bucket above it. Turn counts are capped by
+# the draw threshold, so with maxValue at the threshold plus one every
+# quantile is exact.
+class Histogram:
+
+	def __init__(self, maxValue):
+		self.maxValue = maxValue
+		self.buckets = [0]*(maxValue + 2)
+		self.count = 0
+
+	# Adds one value.
+	def add(self, value):
+		self.buckets[min(value, self.maxValue + 1)] += 1
+		self.count += 1
+
+	# Adds the values counted by other, which must have the same maxValue.
+	def merge(self, other):
+		if not other.maxValue == self.maxValue:
+			raise ValueError("Cannot merge histograms with different ranges")
+		for i in range(0, len(self.buckets)):
+			self.buckets[i] += other.buckets[i]
+		self.count += other.count
+
+	# Returns the rank'th smallest value (from 0). Values in the overflow
+	# bucket are reported as maxValue + 1.
+	def getValue(self, rank):
+		seen = 0
+		for value in range(0, len(self.buckets)):
+			seen += self.buckets[value]
+			if seen > rank:
+				return value
+		return None
+
+	# Returns the median: the mean of the middle two values for an even count.
+	def getMedian(self):
+		if self.count == 0:
+			return None
+		if self.count%2 == 0:
+			return (self.getValue(self.count/2 - 1) + self.getValue(self.count/2))/float(2)
+		return self.getValue(self.count/2)
+
+	# Returns the p'th percentile (0 to 100) by the nearest rank method.
+	def getPercentile(self, p):
+		if self.count == 0:
+			return None
+		rank = int(math.ceil(p/100.0*self.count)) - 1
+		return self.getValue(max(0, rank))
+
+# Totals and maxima of fixed-size integer event counters, one set per game
+# (see game.getEvents). Games are added elementwise into two arrays.
+class EventStats:
+
+	def __init__(self, size):
+		self.count = 0
+		self.totals = array.array("l", [0]*size)
+		self.maxima = array.array("l", [0]*size)
+
+	# Adds the counters of one game.
+	def add(self, events):
+		totals = self.totals
+		maxima = self.maxima
+		for i in range(0, len(totals)):
+			value = events[i]
+			totals[i] += value
+			if value > maxima[i]:
+				maxima[i] = value
+		self.count += 1
+
+	# Adds the games summarized by other, which must have the same size.
+	def merge(self, other):
+		if not len(other.totals) == len(self.totals):
+			raise ValueError("Cannot merge event counters of different sizes")
+		for i in range(0, len(self.totals)):
+			self.totals[i] += other.totals[i]
+			self.maxima[i] = max(self.maxima[i], other.maxima[i])
+		self.count += other.count
+
+	def getCount(self):
+		return self.count
+
+	def getTotal(self, index):
+		return self.totals[index]
+
+	def getMax(self, index):
+		return self.maxima[index]
+
+	# Returns the mean of a counter per game.
+	def getMean(self, index):
+		if self.count == 0:
+			return 0.0
+		return self.totals[index]/float(self.count)
+
+# Outcomes and turn counts of a set of games. Outcome 0 is a draw, 1 a
+# player 1 win and 2 a player 2 win. Turn counts are kept as exact integer
+# sums, so stats merged from blocks of games match those of a serial run.
+class GameStats:
+
+	def __init__(self, maxTurns):
+		self.turns = IntegerStats()
+		self.histogram = Histogram(maxTurns)
+		self.outcomeTurns = [IntegerStats(), IntegerStats(), IntegerStats()]	# Turns broken down by outcome.
+		self.events = None	# EventStats, once a game with event counters is added.
+
+	# Adds one game; winner is 1, 2 or None for a draw. events, if given, is
+	# the game's event counters.
+	def addGame(self, winner, turns, events=None):
+		if winner == None:
+			winner = 0
+		self.turns.add(turns)
+		self.histogram.add(turns)
+		self.outcomeTurns[winner].add(turns)
+		if not events == None:
+			if self.events == None:
+				self.events = EventStats(len(events))
+			self.events.add(events)
+
+	# Adds the games summarized by other.
+	def merge(self, other):
+		self.turns.merge(other.turns)
+		self.histogram.merge(other.histogram)
+		for outcome in range(0, 3):
+			self.outcomeTurns[outcome].merge(other.outcomeTurns[outcome])
+		if not other.events == None:
+			if self.events == None:
+				self.events = EventStats(len(other.events.totals))
+			self.events.merge(other.events)
+
+	def getCount(self):
+		return self.turns.getCount()
+
+	# Returns the number of games with the given outcome (None for draws).
+	def getOutcomeCount(self, winner):
+		if winner == None:
+			winner = 0
+		return self.outcomeTurns[winner].getCount()
+
+	# Returns the IntegerStats of turns for games with the given outcome.
+	def getOutcomeTurns(self, winner):
+		if winner == None:
+			winner = 0
+		return self.outcomeTurns[winner]
+
+	def getTurns(self):
+		return self.turns
+
+	def getHistogram(self):
+		return self.histogram
+
+	# Returns the EventStats of the games, or None if none had event counters.
+	def getEvents(self):
+		return self.events
+
+# Paired results of a duplicate experiment. Each pair adds agent A's scores
+# in its two games (1 for a win, 0.5 for a draw, 0 for a loss); the pair's
+# difference is A's mean score minus B's.
+class PairedStats:
+
+	def __init__(self):
+		self.pairDiffs = RunningStats()
+		self.gameDiffs = RunningStats()	# The same games scored one at a time.
+
+	# Adds one pair of game scores for agent A.
+	def addPair(self, firstScore, secondScore):
+		self.pairDiffs.add(firstScore + secondScore - 1)
+		self.gameDiffs.add(2*firstScore - 1)
+		self.gameDiffs.add(2*secondScore - 1)
+
+	# Adds the pairs summarized by other.
+	def merge(self, other):
+		self.pairDiffs.merge(other.pairDiffs)
+		self.gameDiffs.merge(other.gameDiffs)
+
+	def getPairDiffs(self):
+		return self.pairDiffs
+
+	def getGameDiffs(self):
+		return self.gameDiffs
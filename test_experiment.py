@@ -0,0 +1,36 @@
+import experiment as ex
+import unittest
+import sys
+import StringIO
+
+#######################################################
+#######################################################
+# test_experiment.py
+#
+# Checks that an experiment gives the same results however
+# it is run. Run with: python -m unittest test_experiment
+#######################################################
+#######################################################
+
+# Runs a seeded headless experiment with its output captured and returns
+# the printed SUMMARY STATISTICS section.
+def summaryOf(trials, seed, workers, chunkSize=None):
+	experiment = ex.Experiment(trials, "GREEDY", "RANDOM", False, None, seed=seed, workers=workers, chunkSize=chunkSize)
+	stdout = sys.stdout
+	sys.stdout = StringIO.StringIO()
+	try:
+		experiment.run()
+		output = sys.stdout.getvalue()
+	finally:
+		sys.stdout = stdout
+	return output[output.index("SUMMARY STATISTICS:"):]
+
+class ParallelSummaryTest(unittest.TestCase):
+
+	def testParallelMatchesSerial(self):
+		serial = summaryOf(200, 42, 1)
+		self.assertEqual(serial, summaryOf(200, 42, 3))
+		self.assertEqual(serial, summaryOf(200, 42, 2, 7))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,340 @@
+import experiment as ex
+import GameBoard as gb
+import stats
+import util
+import json
+import math
+import os
+import random
+import zlib
+import multiprocessing
+
+#######################################################
+#######################################################
+# tournament.py
+#
+# Round robin tournaments between agent types. Every
+# ordered pairing (mirror matches included) is played as
+# headless seeded games across a worker pool, the results
+# are cached in a JSON file, and the agents are rated with
+# a Bradley-Terry model reported on the Elo scale.
+# Run with: python tournament.py [agent types...]
+#######################################################
+#######################################################
+
+DEFAULT_TURNS = 100		# Expected game length for a pairing with no results yet.
+PRIOR_DRAWS = 1			# Virtual drawn games added to every pairing when rating.
+ELO_SCALE = 400/math.log(10)	# Converts a Bradley-Terry log strength to Elo points.
+
+# Returns the cache key of the pairing with p1 in seat 1 and p2 in seat 2.
+def pairingKey(p1, p2):
+	return p1 + "|" + p2
+
+# Returns the master seed of a pairing's games. It depends only on the
+# tournament seed and the agent names, so a pairing's games stay the same
+# when agents are added to the tournament.
+def pairingSeed(seed, p1, p2):
+	return util.trialSeed(seed, zlib.crc32(pairingKey(p1, p2)) & 0xFFFFFFFF)
+
+# Plays every ordered pairing of a set of agent types.
+class Tournament:
+
+	# gamesPerPairing games are played for each ordered pairing, split into
+	# jobs of at most blockSize games. Results are cached in cachePath and
+	# reused when the seed, game count and game settings match, so adding an
+	# agent only plays its new pairings.
+	def __init__(self, agentTypes, gamesPerPairing, seed=0, workers=1, boardType=gb.GameBoard, repetitionLimit=None, cachePath="tournament.json", blockSize=50):
+		self.agentTypes = list(agentTypes)
+		self.gamesPerPairing = gamesPerPairing
+		self.seed = seed
+		self.workers = workers
+		self.boardType = boardType
+		self.repetitionLimit = repetitionLimit
+		self.cachePath = cachePath
+		self.blockSize = blockSize
+		self.cache = {}
+		self.results = {}	# Pairing key to its stats.GameStats for this run.
+
+	# Returns the settings a cached result has to match to be reused.
+	def getSettings(self):
+		return {"seed": self.seed, "games": self.gamesPerPairing, "threshold": ex.THRESHOLD,
+			"repetitionLimit": self.repetitionLimit, "boardType": self.boardType.__name__}
+
+	# Returns every ordered pairing of the agents, mirror matches included.
+	def getPairings(self):
+		pairings = []
+		for p1 in self.agentTypes:
+			for p2 in self.agentTypes:
+				pairings.append((p1, p2))
+		return pairings
+
+	#######################################################
+	#######################################################
+	# CACHE:
+	#######################################################
+	#######################################################
+
+	# Reads the cache file, if there is one.
+	def loadCache(self):
+		self.cache = {}
+		if self.cachePath == None or not os.path.exists(self.cachePath):
+			return
+		f = open(self.cachePath)
+		try:
+			self.cache = json.load(f)
+		finally:
+			f.close()
+
+	# Writes the cache file. Written to a temporary file first, so an
+	# interrupted write does not lose earlier results.
+	def saveCache(self):
+		if self.cachePath == None:
+			return
+		tempPath = self.cachePath + ".tmp"
+		f = open(tempPath, "w")
+		try:
+			json.dump(self.cache, f, indent=1, sort_keys=True)
+		finally:
+			f.close()
+		os.rename(tempPath, self.cachePath)
+
+	# Returns the cached result of a pairing played with the current
+	# settings, or None.
+	def getCached(self, p1, p2):
+		entry = self.cache.get(pairingKey(p1, p2))
+		if entry == None or not entry["settings"] == self.getSettings():
+			return None
+		return entry
+
+	# Stores the result of a pairing in the cache.
+	def putCached(self, p1, p2, gameStats):
+		turns = gameStats.getTurns()
+		self.cache[pairingKey(p1, p2)] = {"settings": self.getSettings(), "games": gameStats.getCount(),
+			"wins1": gameStats.getOutcomeCount(1), "wins2": gameStats.getOutcomeCount(2), "draws": gameStats.getOutcomeCount(None),
+			"meanTurns": turns.getMean()}
+
+	# Returns the expected number of turns of a pairing's games: its mean in
+	# the cache under any settings, else the mean over cached pairings with
+	# either agent, else DEFAULT_TURNS.
+	def expectedTurns(self, p1, p2):
+		entry = self.cache.get(pairingKey(p1, p2))
+		if not entry == None:
+			return entry["meanTurns"]
+		related = []
+		for key, entry in self.cache.items():
+			agents = key.split("|")
+			if p1 in agents or p2 in agents:
+				related.append(entry["meanTurns"])
+		if related == []:
+			return DEFAULT_TURNS
+		return sum(related)/len(related)
+
+	#######################################################
+	#######################################################
+	# PLAYING:
+	#######################################################
+	#######################################################
+
+	# Plays every pairing that is not cached and prints the cross table and
+	# ratings. Returns the ratings (see getRatings).
+	def run(self, bootstrap=200):
+		self.loadCache()
+		jobs = []
+		pending = {}	# Pairing key to the number of jobs not yet finished.
+		for p1, p2 in self.getPairings():
+			if not self.getCached(p1, p2) == None:
+				continue
+			self.results[pairingKey(p1, p2)] = stats.GameStats(ex.THRESHOLD + 1)
+			seed = pairingSeed(self.seed, p1, p2)
+			expected = self.expectedTurns(p1, p2)
+			pending[pairingKey(p1, p2)] = 0
+			for first in range(1, self.gamesPerPairing + 1, self.blockSize):
+				last = min(first + self.blockSize - 1, self.gamesPerPairing)
+				args = (first, last, seed, p1, p2, self.boardType, self.repetitionLimit)
+				jobs.append((expected*(last - first + 1), args))
+				pending[pairingKey(p1, p2)] += 1
+
+		print "Tournament: " + ", ".join(self.agentTypes)
+		print str(len(pending)) + " of " + str(len(self.getPairings())) + " pairings to play (" + str(len(jobs)) + " jobs)"
+
+		# Longest jobs first, so a long job does not start last and leave the
+		# other workers idle at the end.
+		jobs.sort(key=lambda job: -job[0])
+		jobArgs = [args for cost, args in jobs]
+		for args, blockStats in self.mapJobs(jobArgs):
+			key = pairingKey(args[3], args[4])
+			self.results[key].merge(blockStats)
+			pending[key] -= 1
+			if pending[key] == 0:
+				self.putCached(args[3], args[4], self.results[key])
+				self.saveCache()
+				print "Finished " + args[3] + " vs. " + args[4]
+
+		self.printCrossTable()
+		ratings = self.getRatings(bootstrap)
+		self.printRatings(ratings)
+		return ratings
+
+	# Yields (args, stats.GameStats) for each job as it finishes, from this
+	# process if there is one worker and from a pool otherwise.
+	def mapJobs(self, jobArgs):
+		if self.workers <= 1:
+			for args in jobArgs:
+				yield (args, playJob(args)[1])
+			return
+		pool = multiprocessing.Pool(self.workers)
+		try:
+			for result in pool.imap_unordered(playJob, jobArgs, 1):
+				yield result
+			pool.close()
+		except:
+			pool.terminate()
+			raise
+		finally:
+			pool.join()
+
+	#######################################################
+	#######################################################
+	# RESULTS:
+	#######################################################
+	#######################################################
+
+	# Returns (wins1, wins2, draws) of a pairing from the cache.
+	def getResult(self, p1, p2):
+		entry = self.getCached(p1, p2)
+		return (entry["wins1"], entry["wins2"], entry["draws"])
+
+	# Prints each pairing's score for the seat 1 agent (rows) against the
+	# seat 2 agent (columns), counting draws as half.
+	def printCrossTable(self):
+		width = max([len(agent) for agent in self.agentTypes] + [7]) + 2
+		print "\n"
+		print "##############################"
+		print "CROSS TABLE (row agent in seat 1):"
+		print "##############################"
+		print "".ljust(width) + "".join([agent.rjust(width) for agent in self.agentTypes])
+		for p1 in self.agentTypes:
+			line = p1.ljust(width)
+			for p2 in self.agentTypes:
+				wins1, wins2, draws = self.getResult(p1, p2)
+				games = wins1 + wins2 + draws
+				line += str(round((wins1 + 0.5*draws)/games, 3)).rjust(width)
+			print line
+
+	# Returns the results between every two agents over both seatings:
+	# wins[i][j] is the games agent i won against agent j and draws[i][j]
+	# the games they drew. Mirror matches are left out.
+	def getResultTables(self):
+		n = len(self.agentTypes)
+		wins = [[0]*n for i in range(0, n)]
+		draws = [[0]*n for i in range(0, n)]
+		for i in range(0, n):
+			for j in range(0, n):
+				if i == j:
+					continue
+				wins1, wins2, numDraws = self.getResult(self.agentTypes[i], self.agentTypes[j])
+				wins[i][j] += wins1
+				wins[j][i] += wins2
+				draws[i][j] += numDraws
+				draws[j][i] += numDraws
+		return (wins, draws)
+
+	# Returns a list of (agent, elo, low, high): each agent's Bradley-Terry
+	# rating on the Elo scale with the mean rating at 0, and a 95% bootstrap
+	# interval from resampling every pairing's games <bootstrap> times.
+	def getRatings(self, bootstrap=200):
+		wins, draws = self.getResultTables()
+		elos = fitElo(wins, draws)
+		rng = random.Random(self.seed)
+		samples = [[] for agent in self.agentTypes]
+		for b in range(0, bootstrap):
+			resampledWins, resampledDraws = resampleResults(wins, draws, rng)
+			for i, elo in enumerate(fitElo(resampledWins, resampledDraws)):
+				samples[i].append(elo)
+
+		ratings = []
+		for i in range(0, len(self.agentTypes)):
+			if bootstrap > 0:
+				samples[i].sort()
+				low = samples[i][int(0.025*(bootstrap - 1))]
+				high = samples[i][int(math.ceil(0.975*(bootstrap - 1)))]
+			else:
+				low = high = elos[i]
+			ratings.append((self.agentTypes[i], elos[i], low, high))
+		ratings.sort(key=lambda rating: -rating[1])
+		return ratings
+
+	# Prints ratings from getRatings.
+	def printRatings(self, ratings):
+		print "\n"
+		print "##############################"
+		print "RATINGS (Elo scale, 95% bootstrap interval):"
+		print "##############################"
+		for agent, elo, low, high in ratings:
+			print agent.ljust(12) + str(int(round(elo))).rjust(6) + "   [" + str(int(round(low))) + ", " + str(int(round(high))) + "]"
+
+# Plays a job of a tournament and returns (args, stats.GameStats).
+# Defined at module level so worker processes can run it.
+def playJob(args):
+	return (args, ex.playTrialBlock(args))
+
+# Fits a Bradley-Terry model to win and draw tables (see getResultTables)
+# with the minorization-maximization updates and returns the ratings on the
+# Elo scale, centred on 0. A draw counts as half a win for each side. Every
+# pairing gets PRIOR_DRAWS virtual draws, so an agent that never lost or
+# never won still has a finite rating.
+def fitElo(wins, draws, iterations=200):
+	n = len(wins)
+	strengths = [1.0]*n
+	for iteration in range(0, iterations):
+		newStrengths = []
+		for i in range(0, n):
+			score = 0.0
+			denominator = 0.0
+			for j in range(0, n):
+				games = wins[i][j] + wins[j][i] + draws[i][j]
+				if i == j or games == 0:
+					continue
+				score += wins[i][j] + 0.5*(draws[i][j] + PRIOR_DRAWS)
+				denominator += (games + PRIOR_DRAWS)/(strengths[i] + strengths[j])
+			if denominator == 0:
+				newStrengths.append(strengths[i])
+			else:
+				newStrengths.append(score/denominator)
+		# Fix the scale: the geometric mean strength is 1.
+		logMean = sum([math.log(s) for s in newStrengths])/n
+		strengths = [s/math.exp(logMean) for s in newStrengths]
+	return [ELO_SCALE*math.log(s) for s in strengths]
+
+# Returns copies of win and draw tables with every pair's games resampled
+# with replacement: the same number of games, each a win, loss or draw with
+# the pair's observed frequencies.
+def resampleResults(wins, draws, rng):
+	n = len(wins)
+	resampledWins = [[0]*n for i in range(0, n)]
+	resampledDraws = [[0]*n for i in range(0, n)]
+	for i in range(0, n):
+		for j in range(i + 1, n):
+			games = wins[i][j] + wins[j][i] + draws[i][j]
+			if games == 0:
+				continue
+			winRate = wins[i][j]/float(games)
+			drawRate = draws[i][j]/float(games)
+			for k in range(0, games):
+				r = rng.random()
+				if r < winRate:
+					resampledWins[i][j] += 1
+				elif r < winRate + drawRate:
+					resampledDraws[i][j] += 1
+					resampledDraws[j][i] += 1
+				else:
+					resampledWins[j][i] += 1
+	return (resampledWins, resampledDraws)
+
+# Runs a tournament between the agent types given on the command line.
+if __name__ == '__main__':
+	import sys
+	agents = sys.argv[1:]
+	if agents == []:
+		agents = ["RANDOM", "GREEDY", "HEURISTIC"]
+	Tournament(agents, 200, workers=multiprocessing.cpu_count()).run()
@@ -0,0 +1,343 @@
+import experiment as ex
+import game as g
+import GameBoard as gb
+import agents
+import featureExtractor as fe
+import util
+import json
+import time
+import sys
+import multiprocessing
+import multiprocessing.sharedctypes
+
+#######################################################
+#######################################################
+# training.py
+#
+# Self-play training for the Q-learning agent. Episodes
+# are headless seeded games against a mix of opponents,
+# played a round at a time across a worker pool with the
+# learner's current weights. Workers record transitions as
+# feature vectors; the learner applies them in episode
+# order and sends its new weights out with the next round,
+# so a run is the same whatever the number of workers.
+#
+# Two other modes let the workers learn as they play. In
+# "hogwild" mode the weights live in one shared memory
+# array that every worker updates in place without locks;
+# in "averaging" mode each worker learns on its own copy
+# and the copies are averaged after every round. Neither
+# mode is reproducible with more than one worker.
+# Run with: python training.py [opponents...]
+#######################################################
+#######################################################
+
+OPPONENTS = ["RANDOM", "GREEDY", "HEURISTIC", "SNAPSHOT"]	# SNAPSHOT is a frozen copy of the learner.
+REPETITION_LIMIT = 3	# A training game is a draw once a position comes up this many times.
+MODES = ["central", "hogwild", "averaging"]
+
+sharedWeights = None	# In hogwild mode, the shared weight array (see initWorker).
+
+# Stores the shared weight array of a hogwild run in this process. Used as
+# the pool initializer, so workers inherit the array rather than a copy.
+def initWorker(weights):
+	global sharedWeights
+	sharedWeights = weights
+
+# Plays the index'th episode of a training run against opponentType, with
+# the learner exploring with probability epsilon. The learner takes seat 1
+# in odd episodes and seat 2 in even ones. Returns (transitions, reward):
+# the learner's recorded transitions and its reward, 1 for a win, -1 for
+# a loss and 0 for a draw. If weightVector is given the learner plays with
+# it instead of weights (see QLearningAgent.useWeightVector).
+def playEpisode(index, masterSeed, weights, opponentType, snapshotWeights, boardType, epsilon, weightVector=None):
+	rng = util.gameRandom(masterSeed, index)
+	opponentGameType = opponentType
+	if opponentType == "SNAPSHOT":
+		opponentGameType = "QLEARNER"
+	learnerSeat = 2 - index%2
+	if learnerSeat == 1:
+		game = g.Game("QLEARNER", opponentGameType, None, boardType, REPETITION_LIMIT, rng, weights=weights)
+	else:
+		game = g.Game(opponentGameType, "QLEARNER", None, boardType, REPETITION_LIMIT, rng, weights=weights)
+	learner = game.getPlayers()[learnerSeat - 1]
+	if weightVector is not None:
+		learner.useWeightVector(weightVector)
+	learner.setEpsilon(epsilon)
+	learner.startRecording()
+	if opponentType == "SNAPSHOT":
+		opponent = game.getPlayers()[2 - learnerSeat]
+		opponent.setWeights(snapshotWeights)
+		opponent.setEpsilon(0.0)
+
+	ex.playGame(game, ex.THRESHOLD)
+	if game.getWinner() == None:
+		reward = 0
+	elif game.getWinner() == learnerSeat:
+		reward = 1
+	else:
+		reward = -1
+	learner.endEpisode(reward)
+	return (learner.getTransitions(), reward)
+
+# Plays a block of episodes; episode i plays opponents[i%len(opponents)].
+# args is (firstIndex, lastIndex, masterSeed, weights, opponents,
+# snapshotWeights, boardType, epsilon, mode, alpha). Returns (results,
+# localWeights): results is a list of (opponentType, transitions, reward)
+# in episode order. In central mode the transitions are left to the
+# learner; in the other modes they are learned after each episode, into
+# the shared weights or a local copy that is returned as localWeights.
+# Defined at module level so worker processes can run it.
+def playEpisodeBlock(args):
+	firstIndex, lastIndex, masterSeed, weights, opponents, snapshotWeights, boardType, epsilon, mode, alpha = args
+	updater = None
+	weightVector = None
+	if not mode == "central":
+		updater = agents.QLearningAgent(0, weights)
+		updater.setAlpha(alpha)
+		if mode == "hogwild":
+			updater.useWeightVector(agents.np.frombuffer(sharedWeights))
+		weightVector = updater.weightVector
+
+	results = []
+	for i in xrange(firstIndex, lastIndex + 1):
+		opponentType = opponents[i%len(opponents)]
+		transitions, reward = playEpisode(i, masterSeed, weights, opponentType, snapshotWeights, boardType, epsilon, weightVector)
+		if updater == None:
+			results.append((opponentType, transitions, reward))
+			continue
+		for features, nextFeatureRows, transitionReward in transitions:
+			updater.learn(features, nextFeatureRows, transitionReward)
+		results.append((opponentType, [], reward))
+
+	if mode == "averaging":
+		return (results, weightVector.tolist())
+	return (results, None)
+
+# Trains one Q-learner by self-play.
+class Trainer:
+
+	# Plays episodes in rounds of roundSize, after each of which the workers
+	# get the learner's new weights. The SNAPSHOT opponent plays with the
+	# learner's weights as of the last multiple of snapshotInterval episodes.
+	# weights are the initial weights (None for zeros). The learning curve
+	# is written to curvePath as JSON if it is given.
+	# With a replayCapacity, transitions go into a replay buffer of that many
+	# and the learner takes minibatches of batchSize from it after each
+	# round, replayRatio times as many sampled transitions as were added
+	# (needs NumPy). Otherwise each transition is learned once, in order.
+	# mode is one of MODES; the hogwild and averaging modes need NumPy and
+	# do not use a replay buffer.
+	# With a checkpointPath (needs NumPy), the weights are saved there (see
+	# checkpoint.py) on a background thread every checkpointInterval
+	# episodes, and at the end. episodesBefore is the number of episodes the
+	# initial weights were trained for, e.g. when warm starting from a
+	# checkpoint.
+	def __init__(self, episodes, opponents=OPPONENTS, workers=1, roundSize=500, snapshotInterval=5000, seed=0, boardType=gb.GameBoard, weights=None, alpha=0.001, epsilon=0.1, curvePath=None, replayCapacity=None, batchSize=64, replayRatio=4, mode="central", checkpointPath=None, checkpointInterval=None, episodesBefore=0):
+		if not mode in MODES:
+			raise ValueError("Unknown training mode " + str(mode))
+		if not mode == "central" and not replayCapacity == None:
+			raise ValueError("A replay buffer needs central training")
+		if not mode == "central" and agents.np == None:
+			raise ValueError("The " + mode + " training mode needs NumPy, which is not installed")
+		if not replayCapacity == None and agents.np == None:
+			raise ValueError("A replay buffer needs NumPy, which is not installed")
+		if not checkpointPath == None and agents.np == None:
+			raise ValueError("Checkpoints need NumPy, which is not installed")
+		self.episodes = episodes
+		self.opponents = list(opponents)
+		self.workers = workers
+		self.roundSize = roundSize
+		self.snapshotInterval = snapshotInterval
+		self.seed = seed
+		self.boardType = boardType
+		self.epsilon = epsilon
+		self.curvePath = curvePath
+		self.mode = mode
+		self.alpha = alpha
+		self.checkpointPath = checkpointPath
+		self.checkpointInterval = checkpointInterval
+		self.episodesBefore = episodesBefore
+		self.learner = agents.QLearningAgent(0, weights)
+		self.learner.setAlpha(alpha)
+		self.shared = None
+		if mode == "hogwild":
+			# The learner's weights are a view of the shared array, so they
+			# follow the workers' updates.
+			self.shared = multiprocessing.sharedctypes.RawArray("d", fe.NUM_FEATURES)
+			weightVector = agents.np.frombuffer(self.shared)
+			weightVector[:] = self.learner.weightVector
+			self.learner.useWeightVector(weightVector)
+		self.snapshot = self.learner.getWeights()
+		self.curve = []		# One point per round; see addCurvePoint.
+		self.batchSize = batchSize
+		self.replayRatio = replayRatio
+		self.replayCapacity = replayCapacity
+		self.replay = None
+		if not replayCapacity == None:
+			import replayBuffer
+			self.replay = replayBuffer.ReplayBuffer(replayCapacity, seed)
+
+	def getLearner(self):
+		return self.learner
+
+	def getCurve(self):
+		return self.curve
+
+	# Plays every round and returns the learner's final weights.
+	def run(self):
+		print "##############################"
+		print "TRAINING: QLEARNER vs. " + ", ".join(self.opponents)
+		print "Episodes: " + str(self.episodes) + " in rounds of " + str(self.roundSize) + ", " + str(self.workers) + " worker(s), " + self.mode + " learning"
+		print "##############################"
+		pool = None
+		if self.workers > 1:
+			pool = multiprocessing.Pool(self.workers, initWorker, (self.shared,))
+		else:
+			initWorker(self.shared)
+		writer = None
+		if not self.checkpointPath == None:
+			import checkpoint
+			writer = checkpoint.CheckpointWriter()
+		start = time.time()
+		try:
+			for first in xrange(1, self.episodes + 1, self.roundSize):
+				last = min(first + self.roundSize - 1, self.episodes)
+				roundStart = time.time()
+				results = self.playRound(pool, first, last)
+				now = time.time()
+				self.addCurvePoint(last, results, (last - first + 1)/max(now - roundStart, 1e-9), now - start)
+				if last/self.snapshotInterval > (first - 1)/self.snapshotInterval:
+					self.snapshot = self.learner.getWeights()
+				if not writer == None and (last == self.episodes or (not self.checkpointInterval == None and last/self.checkpointInterval > (first - 1)/self.checkpointInterval)):
+					writer.save(self.checkpointPath, self.learner.getWeights(), self.getMetadata(last))
+			if not pool == None:
+				pool.close()
+		except:
+			error = sys.exc_info()
+			if not pool == None:
+				pool.terminate()
+			# Write what is waiting, but a failed save must not hide the
+			# error that stopped training.
+			if not writer == None:
+				try:
+					writer.close()
+				except Exception as saveError:
+					print "Checkpoint save also failed: " + str(saveError)
+			raise error[0], error[1], error[2]
+		finally:
+			if not pool == None:
+				pool.join()
+		if not writer == None:
+			writer.close()
+
+		self.printWeights()
+		if not self.curvePath == None:
+			self.writeCurve(self.curvePath)
+		return self.learner.getWeights()
+
+	# Plays episodes first to last from the current weights, split into one
+	# block per worker, learns from them as the mode says and returns their
+	# results in episode order.
+	def playRound(self, pool, first, last):
+		weights = self.learner.getWeights()
+		blockSize = max(1, (last - first + self.workers)/self.workers)
+		blockArgs = [(i, min(i + blockSize - 1, last), self.seed, weights, self.opponents, self.snapshot, self.boardType, self.epsilon, self.mode, self.alpha) for i in xrange(first, last + 1, blockSize)]
+		if pool == None:
+			blocks = map(playEpisodeBlock, blockArgs)
+		else:
+			blocks = pool.map(playEpisodeBlock, blockArgs, 1)
+		results = []
+		for blockResults, localWeights in blocks:
+			results.extend(blockResults)
+		if self.mode == "central":
+			self.learnRound(results)
+		elif self.mode == "averaging":
+			self.learner.setWeights(dict(zip(fe.FEATURES, agents.np.mean([localWeights for blockResults, localWeights in blocks], 0))))
+		return results
+
+	# Learns from the transitions of a round's results: one update each, or
+	# minibatches from the replay buffer once they are added to it.
+	def learnRound(self, results):
+		if self.replay == None:
+			for opponentType, transitions, reward in results:
+				for features, nextFeatureRows, transitionReward in transitions:
+					self.learner.learn(features, nextFeatureRows, transitionReward)
+			return
+		numAdded = 0
+		for opponentType, transitions, reward in results:
+			self.replay.addAll(transitions)
+			numAdded += len(transitions)
+		numBatches = (self.replayRatio*numAdded + self.batchSize - 1)/self.batchSize
+		for i in xrange(0, numBatches):
+			self.learner.learnBatch(*self.replay.sample(self.batchSize))
+
+	# Adds and prints the learning curve point of a round: the learner's win
+	# and draw rates overall and per opponent, and the round's episodes per second.
+	def addCurvePoint(self, episodes, results, episodesPerSecond, seconds):
+		wins = dict([(opponentType, 0) for opponentType in self.opponents])
+		games = dict([(opponentType, 0) for opponentType in self.opponents])
+		draws = 0
+		for opponentType, transitions, reward in results:
+			games[opponentType] += 1
+			if reward == 1:
+				wins[opponentType] += 1
+			elif reward == 0:
+				draws += 1
+		winRates = dict([(opponentType, wins[opponentType]/float(games[opponentType])) for opponentType in self.opponents if games[opponentType] > 0])
+		point = {"episodes": episodes, "winRate": sum(wins.values())/float(len(results)), "drawRate": draws/float(len(results)), "winRates": winRates, "episodesPerSecond": episodesPerSecond, "seconds": seconds}
+		self.curve.append(point)
+
+		output = "Episodes " + str(episodes) + ": win rate " + str(round(point["winRate"], 3)) + " ("
+		output += ", ".join([opponentType + " " + str(round(winRates[opponentType], 3)) for opponentType in self.opponents if opponentType in winRates])
+		output += "), " + str(round(episodesPerSecond, 1)) + " episodes/s"
+		print output
+
+	# Returns the checkpoint metadata after episodes episodes of this run.
+	def getMetadata(self, episodes):
+		return {"episodes": self.episodesBefore + episodes, "opponents": self.opponents, "mode": self.mode, "alpha": self.alpha, "epsilon": self.epsilon, "discount": self.learner.discount, "seed": self.seed, "board": self.boardType.__name__, "features": fe.FEATURES, "time": time.time()}
+
+	# Prints the learner's weights.
+	def printWeights(self):
+		weights = self.learner.getWeights()
+		print "\n"
+		print "Final weights:"
+		for feature in fe.FEATURES:
+			print "  " + feature.ljust(16) + str(round(weights[feature], 5)).rjust(12)
+
+	# Writes the settings, learning curve and final weights to path as JSON.
+	def writeCurve(self, path):
+		output = {
+			"settings": {"episodes": self.episodes, "opponents": self.opponents, "mode": self.mode, "alpha": self.alpha, "roundSize": self.roundSize, "snapshotInterval": self.snapshotInterval, "seed": self.seed, "board": self.boardType.__name__, "epsilon": self.epsilon, "replayCapacity": self.replayCapacity, "batchSize": self.batchSize, "replayRatio": self.replayRatio},
+			"curve": self.curve,
+			"weights": self.learner.getWeights(),
+		}
+		f = open(path, "w")
+		try:
+			json.dump(output, f, indent=1, sort_keys=True)
+		finally:
+			f.close()
+
+# Trains against the opponents given on the command line.
+if __name__ == '__main__':
+	import sys
+	opponents = sys.argv[1:]
+	if opponents == []:
+		opponents = OPPONENTS
+
+	# Carry on from the last run's checkpoint, if there is one. Checkpoints
+	# need NumPy; without it, training starts afresh and saves none.
+	import os
+	checkpointPath = None
+	weights = None
+	episodesBefore = 0
+	if agents.np == None:
+		print "NumPy is not installed; training without checkpoints."
+	else:
+		import checkpoint
+		checkpointPath = "training.npz"
+		if os.path.exists(checkpointPath):
+			weights, metadata = checkpoint.loadCheckpoint(checkpointPath)
+			episodesBefore = metadata.get("episodes", 0)
+			print "Warm start from " + checkpointPath + " (" + str(episodesBefore) + " episodes)"
+	Trainer(10000, opponents, workers=multiprocessing.cpu_count(), curvePath="training.json", weights=weights, checkpointPath=checkpointPath, checkpointInterval=1000, episodesBefore=episodesBefore).run()
@@ -12,10 +12,21 @@ import random
 #######################################################
 
 # Returns the result of flipping a coin with head probability p.
-def flipCoin( p ):
-  r = random.random()
+# rng is the random source: the random module or a random.Random.
+def flipCoin( p, rng=random ):
+  r = rng.random()
   return r < p
 
+# Returns the seed for the trialIndex'th game of an experiment with masterSeed.
+# Every game's seed depends only on this pair, so a game can be replayed on
+# its own and sharded runs match serial ones.
+def trialSeed(masterSeed, trialIndex):
+  return (masterSeed * 1000003 + trialIndex) & 0xFFFFFFFFFFFF
+
+# Returns the random stream for the trialIndex'th game of an experiment with masterSeed.
+def gameRandom(masterSeed, trialIndex):
+  return random.Random(trialSeed(masterSeed, trialIndex))
+
 # Returns a string representation of a list of cards.
 def cardListToString(cardList):
   if cardList == []:
@@ -26,17 +37,51 @@ def cardListToString(cardList):
       output += card.toString() + ","
     return output + "]" 
 
+SUITS = ["C", "S", "D", "H"]
+SUIT_OFFSETS = {"C": 0, "S": 13, "D": 26, "H": 39}
+EMPTY_PILE = 52		# Row of PLAYABLE used when the pile is empty.
+
+# Returns True iff a card of rank is playable (by Scheisskopf rules) on a card of otherRank.
+def rankPlayableOn(rank, otherRank):
+	# Wild cards are playable on anything.
+	if rank == 2 or rank == 3 or rank == 10:
+		return True
+	# 7's case.
+	elif otherRank == 7:
+		return rank <= 7
+	# Normal case.
+	else:
+		return rank >= otherRank
+
 # Represents a single card object with rank, suit, and wildness.
-class Card:
-
-	# Initializes the rank, suit, and wildness of the Card.
-	def __init__(self, rank, suit):
-		self.rank = rank
-		self.suit = suit
-		if self.rank == 2 or self.rank == 3 or self.rank == 10:
-			self.wild = True
-		else:
-			self.wild = False
+# Cards are interned: Card(rank, suit) always returns the same immutable
+# instance from CARDS, so two cards are equal iff they are the same object.
+class Card(object):
+
+	__slots__ = ("rank", "suit", "wild", "index", "string")
+
+	# Returns the canonical Card for rank and suit, creating it on first use.
+	# Cards with an unknown suit are never registered, but still get the
+	# playability row of their rank.
+	def __new__(cls, rank, suit):
+		card = CARD_REGISTRY.get((rank, suit))
+		if card is not None:
+			return card
+		card = object.__new__(cls)
+		setField = object.__setattr__
+		setField(card, "rank", rank)
+		setField(card, "suit", suit)
+		setField(card, "wild", rank == 2 or rank == 3 or rank == 10)
+		setField(card, "index", SUIT_OFFSETS.get(suit, 0) + rank - 2)
+		setField(card, "string", str(suit) + RANK_NAMES.get(rank, str(rank)))
+		return card
+
+	def __setattr__(self, name, value):
+		raise AttributeError("Cards are immutable")
+
+	# Unpickling and copying return the canonical instance.
+	def __reduce__(self):
+		return (Card, (self.rank, self.suit))
 
 	def getRank(self):
 		return self.rank
@@ -49,41 +94,123 @@ class Card:
 
 	# Returns a String representation of the Card.
 	def toString(self):
-		translatedRank = ""
-		if self.rank == 11:
-			translatedRank = "J"
-		elif self.rank == 12:
-			translatedRank = "Q"
-		elif self.rank == 13:
-			translatedRank = "K"
-		elif self.rank == 14:
-			translatedRank = "A"
-		else:
-			translatedRank = str(self.rank)
-
-		return str(self.suit) + translatedRank
+		return self.string
 
 	# Returns True iff this card is playable (by Scheisskopf rules) on otherCard.
 	def isPlayableOn(self, otherCard):
-		# Pile is empty.
-		if otherCard == None:
-			return True
-		# Wild cards are playable on anything.
-		elif self.wild:
-			return True
-		# 7's case.
-		elif otherCard.rank == 7:
-			if self.rank <= 7:
-				return True
-			else:
-				return False
-		# Normal case.
-		else:
-			if self.rank >= otherCard.getRank():
-				return True
-			else:
-				return False
+		if otherCard is None:
+			return PLAYABLE[EMPTY_PILE][self.index]
+		return PLAYABLE[otherCard.index][self.index]
+
+RANK_NAMES = {11: "J", 12: "Q", 13: "K", 14: "A"}
+
+# The 52 canonical cards, ordered by index (suit-major, then rank).
+CARD_REGISTRY = dict()
+CARDS = []
+for suit in SUITS:
+	for rank in range(2, 15):
+		CARDS.append(Card(rank, suit))
+		CARD_REGISTRY[(rank, suit)] = CARDS[-1]
+del suit, rank
+
+# PLAYABLE[i][j] is True iff the card with index j is playable on the card
+# with index i. Row EMPTY_PILE is the empty pile.
+PLAYABLE = tuple([tuple([rankPlayableOn(card.rank, pileCard.rank) for card in CARDS]) for pileCard in CARDS] + [tuple([True] * 52)])
+
+# Returns the canonical Card with rank and suit.
+def getCard(rank, suit):
+	return CARD_REGISTRY[(rank, suit)]
+
+# Ranks ordered from least to most valuable: 4 < 5 < ... < A < 2 < 10 < 3.
+VALUE_ORDER = [4, 5, 6, 7, 8, 9, 11, 12, 13, 14, 2, 10, 3]
+NON_WILD_RANKS = [4, 5, 6, 7, 8, 9, 11, 12, 13, 14]
+
+# RANK_PLAYABLE[otherRank][rank] is True iff rank is playable on otherRank.
+# Row 0 is the empty pile.
+RANK_PLAYABLE = [[True] * 15] + [[rankPlayableOn(rank, otherRank) for rank in range(0, 15)] for otherRank in range(1, 15)]
+
+# Returns the RANK_PLAYABLE row for the card on top of the pile (None if empty).
+def playableRanks(pileCard):
+	if pileCard is None:
+		return RANK_PLAYABLE[0]
+	return RANK_PLAYABLE[pileCard.rank]
+
+# A 13-bucket index of a collection of cards by rank. Used by the GameBoard
+# to keep every hand indexed as cards come and go, so agents can ask about
+# ranks without rescanning the hand.
+class RankIndex:
+
+	# Bucket rank-2 holds the cards of that rank.
+	def __init__(self, cards=()):
+		self.buckets = [[] for i in range(0, 13)]
+		self.addList(cards)
+
+	def add(self, card):
+		self.buckets[card.rank - 2].append(card)
+
+	def addList(self, cards):
+		for card in cards:
+			self.buckets[card.rank - 2].append(card)
+
+	def remove(self, card):
+		self.buckets[card.rank - 2].remove(card)
 
+	# Refills the buckets from cards, so each bucket is in their order.
+	def rebuild(self, cards):
+		for bucket in self.buckets:
+			del bucket[:]
+		self.addList(cards)
+
+	# Returns the number of cards of rank.
+	def count(self, rank):
+		return len(self.buckets[rank - 2])
+
+	# Returns True iff there is at least one card of rank.
+	def containsRank(self, rank):
+		return not self.buckets[rank - 2] == []
+
+	# Returns a list of all cards of rank.
+	def getAllOfRank(self, rank):
+		return list(self.buckets[rank - 2])
+
+	# Returns a list containing a single card of rank.
+	def getOneOfRank(self, rank):
+		return self.buckets[rank - 2][:1]
+
+	# Returns True iff there is a card of rank and it is playable on pileCard.
+	def containsPlayableRank(self, rank, pileCard):
+		return playableRanks(pileCard)[rank] and not self.buckets[rank - 2] == []
+
+	# Returns the numerically lowest rank playable on pileCard, or None.
+	def lowestPlayableRank(self, pileCard):
+		playable = playableRanks(pileCard)
+		for rank in range(2, 15):
+			if playable[rank] and not self.buckets[rank - 2] == []:
+				return rank
+		return None
+
+	# Returns the least valuable rank playable on pileCard, or None.
+	def worstPlayableRank(self, pileCard):
+		playable = playableRanks(pileCard)
+		for rank in VALUE_ORDER:
+			if playable[rank] and not self.buckets[rank - 2] == []:
+				return rank
+		return None
+
+	# Returns the most valuable rank present, or None.
+	def bestRank(self):
+		for rank in reversed(VALUE_ORDER):
+			if not self.buckets[rank - 2] == []:
+				return rank
+		return None
+
+	# Returns True iff every card playable on pileCard is wild.
+	def onlyWilds(self, pileCard):
+		playable = playableRanks(pileCard)
+		for rank in NON_WILD_RANKS:
+			if playable[rank] and not self.buckets[rank - 2] == []:
+				return False
+		return True
 
 # A general purpose, last in first out (LIFO) data structure.
 # In our implementation, used for representing stacks of Cards.
@@ -133,6 +260,53 @@ class Stack:
 		return output
 
 
+# A Stack of Cards that also tracks the runs of equal ranks in it, so the
+# rank and length of the run on top can be read without touching the cards.
+# runRanks and runLengths hold one entry per run, bottom to top.
+class PileStack(Stack):
+
+	def __init__(self):
+		Stack.__init__(self)
+		self.runRanks = []
+		self.runLengths = []
+
+	# Removes the topmost card from the stack and returns it.
+	def pop(self):
+		if not self.list == []:
+			if self.runLengths[-1] == 1:
+				self.runRanks.pop()
+				self.runLengths.pop()
+			else:
+				self.runLengths[-1] -= 1
+			return self.list.pop()
+
+	# Adds card to the stack, extending the top run if it has the same rank.
+	def push(self, card):
+		self.list.append(card)
+		if not self.runRanks == [] and self.runRanks[-1] == card.rank:
+			self.runLengths[-1] += 1
+		else:
+			self.runRanks.append(card.rank)
+			self.runLengths.append(1)
+
+	# Push an entire list onto the stack. Note that the last element of the list
+	# becomes the new topmost element of the stack.
+	def pushList(self, list):
+		for card in list:
+			self.push(card)
+
+	# Returns the rank of the run on top of the stack (None if empty).
+	def topRunRank(self):
+		if self.runRanks == []:
+			return None
+		return self.runRanks[-1]
+
+	# Returns the number of cards in the run on top of the stack.
+	def topRunLength(self):
+		if self.runLengths == []:
+			return 0
+		return self.runLengths[-1]
+
 class Counter(dict):
   """
   A counter keeps track of counts for a set of keys.